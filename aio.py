@@ -0,0 +1,61 @@
+import asyncio
+import os
+import threading
+
+
+class AsyncRuntime:
+    """One asyncio loop per process, run in a background thread.
+
+    Sync code (Flask views under any worker class) hands coroutines to
+    submit(). Coroutines share one pooled aiohttp.ClientSession, so a
+    process can keep thousands of REST calls in flight without a thread
+    each. aiohttp is only needed when this is used (see
+    requirements-async.txt).
+    """
+
+    def __init__(self, max_connections=1000, timeout=10):
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._loop = None
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self):
+        # the loop thread does not survive a fork, so start one per worker
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name="aio-loop", daemon=True).start()
+                    self._loop = loop
+                    self._session = None
+                    self._pid = os.getpid()
+        return self._loop
+
+    def submit(self, coro):
+        """Schedule coro on the loop; returns a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    @property
+    def session(self):
+        """Shared aiohttp.ClientSession; only touch it from coroutines running on the loop"""
+        if self._session is None:
+            import aiohttp
+
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    def close(self, timeout=5):
+        """Close the shared session; the loop thread dies with the process"""
+        if self._pid != os.getpid() or self._session is None:
+            return
+
+        async def close_session():
+            await self._session.close()
+
+        self.submit(close_session()).result(timeout=timeout)
@@ -0,0 +1,22 @@
+"""ASGI entry point for the async deployment mode.
+
+    gunicorn -k uvicorn_worker.UvicornWorker -w 2 asgi:app
+
+Serves the same call_me routes, but only campaign dialing is async: it
+runs as coroutines over one shared, pooled async HTTP client (see aio.py),
+so a worker can keep thousands of REST calls in flight. Webhook views are
+still the sync Flask views, run on a pool of ASGI_WSGI_THREADS threads per
+worker, so at most that many webhooks are in flight per worker; they are
+also served slower than by the sync deployment (274 vs 453 req/s in
+bench.webhooks). Use this mode for large campaigns and the sync deployment
+(gunicorn call_me:app, unchanged) for webhook throughput.
+"""
+import os
+
+os.environ.setdefault("ASYNC_MODE", "1")
+
+from a2wsgi import WSGIMiddleware
+
+from call_me import app as flask_app
+
+app = WSGIMiddleware(flask_app, workers=int(os.getenv("ASGI_WSGI_THREADS", "32")))
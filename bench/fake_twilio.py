@@ -0,0 +1,157 @@
+"""Local stand-in for the parts of the Twilio REST API the app talks to.
+
+Answers POST .../Calls.json with a queued call and GET on any recording
+URL with a small audio body. When the call create carries a
+StatusCallback, the call's progress (initiated, ringing, then answered and
+completed, busy, no-answer or failed) is posted back to it. Used by the benchmarks and handy for trying
+the dialer by hand:
+
+    python -m bench.fake_twilio --port 8765
+    TWILIO_API_BASE=http://127.0.0.1:8765 gunicorn call_me:app
+
+It runs on its own asyncio loop so thousands of concurrent keep-alive
+connections cost it next to nothing and it does not become the bottleneck
+of a dialer benchmark.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+REASONS = {200: "OK", 201: "Created", 404: "Not Found", 503: "Service Unavailable"}
+
+# How fake calls end, picked round robin: mostly answered, some not
+OUTCOMES = ("completed",) * 7 + ("busy", "no-answer", "failed")
+
+
+class FakeTwilio:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, error_rate=0.0, audio_bytes=32 * 1024,
+                 status_delay=0.05, retry_after=None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.error_rate = error_rate
+        # sent as Retry-After on the 503s of error_rate when set
+        self.retry_after = retry_after
+        self.audio = b"\0" * audio_bytes
+        self.calls_created = 0
+        self.created_at = []
+        self.status_delay = status_delay
+        self.status_sent = 0
+        self.status_errors = 0
+        self._tasks = set()
+        self._ids = itertools.count()
+        self._loop = asyncio.new_event_loop()
+        self._server = self._loop.run_until_complete(
+            asyncio.start_server(self._handle, host, port, backlog=4096))
+        self.url = f"http://{host}:{self._server.sockets[0].getsockname()[1]}"
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                method, path, _ = request_line.split(" ", 2)
+                headers = {}
+                for line in header_lines:
+                    if ":" in line:
+                        name, value = line.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length") or 0)
+                form = await reader.readexactly(length) if length else b""
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                status, body, content_type = self._respond(method, path, form)
+                retry_after = f"Retry-After: {self.retry_after}\r\n" if status == 503 and self.retry_after else ""
+                writer.write(
+                    f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: {content_type}\r\n{retry_after}"
+                    f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def _respond(self, method, path, form=b""):
+        if method == "GET":
+            return 200, self.audio, "audio/mpeg"
+        if not path.endswith("/Calls.json"):
+            return 404, b'{"message": "not found"}', "application/json"
+        n = next(self._ids)
+        self.calls_created += 1
+        self.created_at.append(time.perf_counter())
+        if self.error_rate and (n % int(1 / self.error_rate)) == 0:
+            return 503, b'{"message": "service unavailable"}', "application/json"
+        params = dict(parse_qsl(form.decode("latin-1")))
+        if params.get("StatusCallback"):
+            # the loop only keeps weak references to tasks
+            task = self._loop.create_task(self._report_progress(params["StatusCallback"], f"CA{n:032x}",
+                                                                params.get("To"), n))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return 201, json.dumps({"sid": f"CA{n:032x}", "status": "queued"}).encode(), "application/json"
+
+    async def _report_progress(self, url, sid, to, n):
+        outcome = OUTCOMES[n % len(OUTCOMES)]
+        events = [("initiated", None), ("ringing", None)]
+        if outcome == "completed":
+            events += [("in-progress", None), ("completed", str(n % 120 + 1))]
+        else:
+            events.append((outcome, None))
+        for status, duration in events:
+            await asyncio.sleep(self.status_delay)
+            form = {"CallSid": sid, "To": to or "", "CallStatus": status}
+            if duration:
+                form["CallDuration"] = duration
+            await self._post(url, form)
+
+    async def _post(self, url, form):
+        parts = urlsplit(url)
+        body = urlencode(form).encode()
+        try:
+            reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+            writer.write(
+                f"POST {parts.path}?{parts.query} HTTP/1.1\r\nHost: {parts.netloc}\r\nConnection: close\r\n"
+                f"Content-Type: application/x-www-form-urlencoded\r\nContent-Length: {len(body)}\r\n\r\n"
+                .encode("latin-1") + body)
+            await writer.drain()
+            status_line = await reader.readline()
+            ok = status_line[9:12] in (b"200", b"204")
+            writer.close()
+        except OSError:
+            ok = False
+        if ok:
+            self.status_sent += 1
+        else:
+            self.status_errors += 1
+
+    def start(self):
+        threading.Thread(target=self._loop.run_forever, name="fake-twilio", daemon=True).start()
+        return self
+
+    def stop(self):
+        async def close():
+            self._server.close()
+
+        asyncio.run_coroutine_threadsafe(close(), self._loop).result(timeout=5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def serve_forever(self):
+        self._loop.run_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local fake of the Twilio REST API")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of call creates answered with 503")
+    parser.add_argument("--retry-after", help="Retry-After header sent with those 503s")
+    args = parser.parse_args()
+    fake = FakeTwilio(port=args.port, latency=args.latency, error_rate=args.error_rate, retry_after=args.retry_after)
+    print(f"Fake Twilio API on {fake.url}")
+    fake.serve_forever()
@@ -0,0 +1,186 @@
+"""Cold start benchmark for call_me.py.
+
+Measures, in fresh interpreters so nothing is already imported:
+
+  import        time to import call_me
+  first_request the first /voice webhook after import (lazy work included)
+  steady        median of the following /voice webhooks
+
+and, for each gunicorn deployment asked for, the time from launching the
+server until it answers its first webhook plus the private (not shared
+with the master) memory of each worker, with and without --preload:
+
+    python -m bench.startup --runs 5 --workers 4 --save-baseline bench/startup-baseline.json
+    python -m bench.startup --runs 5 --workers 4 --compare bench/startup-baseline.json
+
+Worker memory is read from /proc and is only reported on Linux.
+"""
+import argparse
+import http.client
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench.webhooks import ROOT, free_port
+
+PROBE = """
+import json, time
+started = time.perf_counter()
+import call_me
+imported = time.perf_counter()
+client = call_me.app.test_client()
+form = {"CallSid": "CA0", "From": "+15550000000"}
+client.post("/voice", data=form)
+first = time.perf_counter()
+steady = []
+for _ in range(50):
+    t = time.perf_counter()
+    client.post("/voice", data=form)
+    steady.append(time.perf_counter() - t)
+steady.sort()
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "first_request_ms": (first - imported) * 1000,
+    "steady_ms": steady[len(steady) // 2] * 1000,
+}))
+"""
+
+
+def bench_env(workdir, with_credentials):
+    env = dict(os.environ)
+    for name in ("TWILIO_ACCOUNT_SID", "TWILIO_AUTH_TOKEN", "TWILIO_FROM_NUMBER"):
+        env.pop(name, None)
+    if with_credentials:
+        env.update({"TWILIO_ACCOUNT_SID": "ACbenchmark", "TWILIO_AUTH_TOKEN": "benchmark",
+                    "TWILIO_FROM_NUMBER": "+15550000000"})
+    env.update({
+        "PYTHONPATH": ROOT,
+        "RECORDINGS_DB": os.path.join(workdir, "recordings.db"),
+        "RECORDINGS_DIR": os.path.join(workdir, "recordings"),
+        "CALL_STATE_DB": os.path.join(workdir, "call_state.db"),
+        "CALL_STATUS_DB": os.path.join(workdir, "call_status.db"),
+        "DIALER_DB": os.path.join(workdir, "dialer.db"),
+        "EVENT_LOG_DIR": os.path.join(workdir, "events"),
+        "EVENT_LOG_DB": os.path.join(workdir, "events.db"),
+        "PROMPT_AUDIO_DIR": os.path.join(workdir, "prompt_audio"),
+    })
+    return env
+
+
+def measure_import(runs, env):
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", PROBE], cwd=env["PYTHONPATH"], env=env,
+                             capture_output=True, text=True, check=True).stdout
+        samples.append(json.loads(out.strip().splitlines()[-1]))
+    return {k: round(statistics.median(s[k] for s in samples), 2) for k in samples[0]}
+
+
+def worker_private_mb(master_pid):
+    """Mean private memory of the master's children, None where /proc is unavailable"""
+    try:
+        with open(f"/proc/{master_pid}/task/{master_pid}/children") as f:
+            pids = f.read().split()
+        sizes = []
+        for pid in pids:
+            private = 0
+            with open(f"/proc/{pid}/smaps_rollup") as f:
+                for line in f:
+                    if line.startswith(("Private_Clean:", "Private_Dirty:")):
+                        private += int(line.split()[1])
+            sizes.append(private / 1024)
+    except OSError:
+        return None
+    return round(statistics.mean(sizes), 1) if sizes else None
+
+
+def measure_boot(workers, preload, env, timeout=30):
+    port = free_port()
+    env = dict(env, GUNICORN_PRELOAD="1" if preload else "0")
+    cmd = [sys.executable, "-m", "gunicorn", "-w", str(workers), "-b", f"127.0.0.1:{port}",
+           "--log-level", "warning", "call_me:app"]
+    started = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            if proc.poll() is not None:
+                raise RuntimeError(f"gunicorn exited with {proc.returncode}")
+            if time.monotonic() > deadline:
+                raise RuntimeError("gunicorn did not come up")
+            try:
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+                conn.request("POST", "/voice", body="", headers={"Content-Type": "application/x-www-form-urlencoded"})
+                if conn.getresponse().status == 200:
+                    break
+            except OSError:
+                time.sleep(0.01)
+        ready_ms = (time.perf_counter() - started) * 1000
+        # let every worker finish booting before reading its memory
+        time.sleep(1)
+        return {"ready_ms": round(ready_ms, 1), "worker_private_mb": worker_private_mb(proc.pid)}
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def compare(current, baseline, tolerance):
+    """List of human-readable regressions of current against baseline"""
+    regressions = []
+    for config, stats in current.items():
+        for metric, value in stats.items():
+            base = baseline.get(config, {}).get(metric)
+            if base and value is not None and value > base * (1 + tolerance):
+                regressions.append(f"{config} {metric}: {base} -> {value}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per import measurement")
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn workers, 0 to skip the server runs")
+    parser.add_argument("--save-baseline", metavar="PATH")
+    parser.add_argument("--compare", metavar="PATH")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    parser.add_argument("--json", metavar="PATH", help="also write the raw report here")
+    args = parser.parse_args(argv)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        results["webhooks-only"] = measure_import(args.runs, bench_env(workdir, with_credentials=False))
+        results["with-credentials"] = measure_import(args.runs, bench_env(workdir, with_credentials=True))
+        if args.workers:
+            env = bench_env(workdir, with_credentials=True)
+            for preload in (False, True):
+                config = f"gunicorn-w{args.workers}" + ("-preload" if preload else "")
+                results[config] = measure_boot(args.workers, preload, env)
+
+    for config, stats in results.items():
+        print(f"{config:<24}" + "  ".join(f"{k}={v}" for k, v in stats.items()))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump({"created_at": time.time(), "results": results}, f, indent=2)
+        print(f"\nBaseline written to {args.save_baseline}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("\nNo regressions against baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,353 @@
+"""Webhook load test for call_me.py under gunicorn.
+
+Starts the app under gunicorn for every requested workers x threads
+combination and replays Twilio-style call flows against it: voice ->
+handle-language -> handle-main -> doctor/pathology -> handle-recording,
+with form-encoded Digits, CallSid and From. A share of the traffic posts
+small campaigns to /make-call, which the app dials against a local fake
+of the Twilio REST API (see bench/fake_twilio.py), and --status-share
+posts bursts of campaign status callbacks to /call-status.
+
+Reports throughput and p50/p95/p99 latency per route, and can save the
+result as a baseline or compare against one:
+
+    python -m bench.webhooks --workers 1,4 --threads 1,8 --save-baseline bench/baseline.json
+    python -m bench.webhooks --workers 1,4 --threads 1,8 --compare bench/baseline.json
+
+--modes sync,async runs every combination against both deployments: the
+sync one (gunicorn call_me:app) and the async one (asgi.py under uvicorn
+workers, where --threads sizes the WSGI thread pool). --campaign-size N
+also posts one N-number campaign after the load and reports how long each
+call took to reach the fake REST API as the "campaign" row.
+"""
+import argparse
+import http.client
+import itertools
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+from bench.fake_twilio import FakeTwilio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def call_flow(rng, call_n, fake_url):
+    """One caller's sequence of (path, form) webhook requests"""
+    call_sid = f"CA{call_n:032x}"
+    caller = f"+9198{rng.randrange(10 ** 8):08d}"
+    lang_digit = rng.choice("1123")
+    lang = {"1": "en", "2": "hi", "3": "mr"}[lang_digit]
+    steps = [("/voice", "")]
+    if rng.random() < 0.1:
+        steps.append(("/handle-language", "9"))
+    steps.append(("/handle-language", lang_digit))
+
+    branch = rng.choices(["appointment", "pathology", "emergency", "timeout"], weights=[45, 35, 10, 10])[0]
+    if branch == "emergency":
+        steps.append((f"/handle-main?lang={lang}", "2"))
+    elif branch == "timeout":
+        steps.append((f"/handle-main?lang={lang}", ""))
+    else:
+        main_digit, node, rtype, extra = {
+            "appointment": ("1", "/handle-appointment-doctor", "appointment", "doctor"),
+            "pathology": ("3", "/handle-pathology", "pathology", "test"),
+        }[branch]
+        steps.append((f"/handle-main?lang={lang}", main_digit))
+        if rng.random() < 0.15:
+            steps.append((f"{node}?lang={lang}", "7"))
+        steps.append((f"{node}?lang={lang}", rng.choice("123")))
+        steps.append((f"/handle-recording?type={rtype}&{extra}=x&lang={lang}", None))
+
+    flow = []
+    for path, digits in steps:
+        form = {"CallSid": call_sid, "From": caller}
+        if digits is not None:
+            form["Digits"] = digits
+        else:
+            form.update({
+                "RecordingSid": f"RE{call_n:032x}",
+                "RecordingUrl": f"{fake_url}/Recordings/RE{call_n:032x}",
+                "RecordingDuration": str(rng.randrange(3, 60)),
+            })
+        flow.append((path, form))
+    return flow
+
+
+class Client:
+    """Keep-alive HTTP client that reconnects when the server closes"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.conn = None
+
+    def request(self, method, path, body, headers):
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            try:
+                self.conn.request(method, path, body=body, headers=headers)
+                resp = self.conn.getresponse()
+                resp.read()
+                if resp.getheader("Connection", "").lower() == "close":
+                    self.conn.close()
+                    self.conn = None
+                return resp.status
+            except (http.client.HTTPException, OSError):
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+
+
+STATUS_PROGRESS = ("initiated", "ringing", "in-progress", "completed")
+
+
+def run_load(host, port, concurrency, duration, fake_url, make_call_share, status_share=0.0, seed=0):
+    samples = {}
+    errors = {}
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+    counter = iter(range(10 ** 9))
+
+    def record(route, elapsed, ok):
+        with lock:
+            samples.setdefault(route, []).append(elapsed)
+            if not ok:
+                errors[route] = errors.get(route, 0) + 1
+
+    def worker(n):
+        rng = random.Random(seed * 1000 + n)
+        client = Client(host, port)
+        while time.monotonic() < stop_at:
+            if rng.random() < make_call_share:
+                body = json.dumps({"to": [f"+1555{rng.randrange(10 ** 7):07d}" for _ in range(5)]})
+                started = time.perf_counter()
+                status = client.request("POST", "/make-call", body, {"Content-Type": "application/json"})
+                record("/make-call", time.perf_counter() - started, status == 202)
+                continue
+            if rng.random() < status_share:
+                # one campaign call reporting its progress
+                with lock:
+                    call_n = next(counter)
+                query = urlencode({"job": f"bench-{n}", "i": call_n})
+                for call_status in STATUS_PROGRESS:
+                    form = {"CallSid": f"CA{call_n:032x}", "To": "+15550000000", "CallStatus": call_status,
+                            "CallDuration": "30"}
+                    started = time.perf_counter()
+                    status = client.request("POST", f"/call-status?{query}", urlencode(form),
+                                            {"Content-Type": "application/x-www-form-urlencoded"})
+                    record("/call-status", time.perf_counter() - started, status == 204)
+                continue
+            with lock:
+                call_n = next(counter)
+            for path, form in call_flow(rng, call_n, fake_url):
+                started = time.perf_counter()
+                try:
+                    status = client.request("POST", path, urlencode(form),
+                                            {"Content-Type": "application/x-www-form-urlencoded"})
+                except (http.client.HTTPException, OSError):
+                    status = None
+                record(path.split("?")[0], time.perf_counter() - started, status == 200)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return samples, errors, time.monotonic() - started
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = max(0, int(round(pct / 100 * len(sorted_values))) - 1)
+    return sorted_values[index]
+
+
+def summarize(samples, errors, elapsed):
+    report = {}
+    all_values = []
+    for route, values in sorted(samples.items()):
+        values.sort()
+        all_values.extend(values)
+        report[route] = _stats(values, errors.get(route, 0), elapsed)
+    all_values.sort()
+    report["all"] = _stats(all_values, sum(errors.values()), elapsed)
+    return report
+
+
+def _stats(values, error_count, elapsed):
+    return {
+        "count": len(values),
+        "errors": error_count,
+        "rps": round(len(values) / elapsed, 1),
+        "p50_ms": round(percentile(values, 50) * 1000, 2),
+        "p95_ms": round(percentile(values, 95) * 1000, 2),
+        "p99_ms": round(percentile(values, 99) * 1000, 2),
+    }
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(mode, workers, threads, port, env):
+    cmd = [sys.executable, "-m", "gunicorn", "-w", str(workers), "-b", f"127.0.0.1:{port}", "--log-level", "warning"]
+    if mode == "async":
+        env = dict(env, ASYNC_MODE="1", ASGI_WSGI_THREADS=str(threads))
+        cmd += ["-k", "uvicorn_worker.UvicornWorker", "asgi:app"]
+    else:
+        cmd += ["--threads", str(threads), "call_me:app"]
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with {proc.returncode}")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/test-languages")
+            if conn.getresponse().status == 200:
+                return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError("gunicorn did not come up")
+
+
+def run_campaign(host, port, fake, size, timeout=120):
+    """Post one campaign and time how long each call takes to reach the REST API"""
+    before = len(fake.created_at)
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    body = json.dumps({"to": [f"+1666{n:07d}" for n in range(size)]})
+    posted = time.perf_counter()
+    conn.request("POST", "/make-call", body=body, headers={"Content-Type": "application/json"})
+    ok = conn.getresponse().status == 202
+    deadline = time.monotonic() + timeout
+    while len(fake.created_at) - before < size and time.monotonic() < deadline:
+        time.sleep(0.05)
+    created = sorted(t - posted for t in fake.created_at[before:before + size])
+    elapsed = created[-1] if created else timeout
+    return _stats(created, 0 if ok else size, elapsed)
+
+
+def server_env(fake_url, workdir, dialer_workers):
+    env = dict(os.environ)
+    env.update({
+        "TWILIO_ACCOUNT_SID": env.get("TWILIO_ACCOUNT_SID", "ACbenchmark"),
+        "TWILIO_AUTH_TOKEN": env.get("TWILIO_AUTH_TOKEN", "benchmark"),
+        "TWILIO_FROM_NUMBER": env.get("TWILIO_FROM_NUMBER", "+15550000000"),
+        "TWILIO_API_BASE": fake_url,
+        "DIALER_CALLS_PER_SECOND": "1000",
+        "DIALER_WORKERS": str(dialer_workers),
+        "RECORDINGS_DB": os.path.join(workdir, "recordings.db"),
+        "RECORDINGS_DIR": os.path.join(workdir, "recordings"),
+        "CALL_STATE_DB": os.path.join(workdir, "call_state.db"),
+        "CALL_STATUS_DB": os.path.join(workdir, "call_status.db"),
+        "DIALER_DB": os.path.join(workdir, "dialer.db"),
+        "EVENT_LOG_DIR": os.path.join(workdir, "events"),
+        "EVENT_LOG_DB": os.path.join(workdir, "events.db"),
+    })
+    return env
+
+
+def compare(current, baseline, tolerance):
+    """List of human-readable regressions of current against baseline"""
+    regressions = []
+    for config, routes in current.items():
+        for route, stats in routes.items():
+            base = baseline.get(config, {}).get(route)
+            if not base:
+                continue
+            if base["p95_ms"] and stats["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+                regressions.append(f"{config} {route}: p95 {base['p95_ms']}ms -> {stats['p95_ms']}ms")
+            if base["rps"] and stats["rps"] < base["rps"] * (1 - tolerance):
+                regressions.append(f"{config} {route}: rps {base['rps']} -> {stats['rps']}")
+    return regressions
+
+
+def print_report(config, report):
+    print(f"\n== {config}")
+    print(f"{'route':<28}{'count':>8}{'err':>6}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for route, s in report.items():
+        print(f"{route:<28}{s['count']:>8}{s['errors']:>6}{s['rps']:>9}{s['p50_ms']:>9}{s['p95_ms']:>9}{s['p99_ms']:>9}")
+
+
+def parse_ints(value):
+    return [int(v) for v in value.split(",") if v]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", type=lambda v: v.split(","), default=["sync"], help="sync, async or both")
+    parser.add_argument("--workers", type=parse_ints, default=[1, 2, 4])
+    parser.add_argument("--threads", type=parse_ints, default=[1, 4])
+    parser.add_argument("--concurrency", type=int, default=16, help="simultaneous simulated callers")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per configuration")
+    parser.add_argument("--make-call-share", type=float, default=0.02,
+                        help="fraction of client iterations that post a campaign instead of a call flow")
+    parser.add_argument("--status-share", type=float, default=0.0,
+                        help="fraction of client iterations that post a call's status callbacks instead")
+    parser.add_argument("--twilio-latency", type=float, default=0.05, help="simulated REST API latency in seconds")
+    parser.add_argument("--campaign-size", type=int, default=0, help="numbers in the timed campaign, 0 to skip")
+    parser.add_argument("--dialer-workers", type=int, default=64, help="in-flight REST calls per app process")
+    parser.add_argument("--save-baseline", metavar="PATH")
+    parser.add_argument("--compare", metavar="PATH")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    parser.add_argument("--json", metavar="PATH", help="also write the raw report here")
+    args = parser.parse_args(argv)
+
+    fake = FakeTwilio(latency=args.twilio_latency).start()
+    results = {}
+    try:
+        for mode, workers, threads in itertools.product(args.modes, args.workers, args.threads):
+            config = f"w{workers}t{threads}" if mode == "sync" else f"{mode}-w{workers}t{threads}"
+            port = free_port()
+            with tempfile.TemporaryDirectory() as workdir:
+                proc = start_server(mode, workers, threads, port, server_env(fake.url, workdir, args.dialer_workers))
+                try:
+                    samples, errors, elapsed = run_load("127.0.0.1", port, args.concurrency, args.duration,
+                                                        fake.url, args.make_call_share, args.status_share)
+                    results[config] = summarize(samples, errors, elapsed)
+                    if args.campaign_size:
+                        results[config]["campaign"] = run_campaign("127.0.0.1", port, fake, args.campaign_size)
+                finally:
+                    proc.terminate()
+                    proc.wait()
+            print_report(config, results[config])
+    finally:
+        fake.stop()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump({"created_at": time.time(), "concurrency": args.concurrency, "results": results}, f, indent=2)
+        print(f"\nBaseline written to {args.save_baseline}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("\nNo regressions against baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,21 @@
+import atexit
+import math
 import os
-from flask import Flask, request, Response, jsonify
-from twilio.rest import Client
-from twilio.twiml.voice_response import VoiceResponse, Gather, Dial, Record
+import threading
+import time
+from flask import Flask, request, Response, jsonify, send_from_directory
 from dotenv import load_dotenv
+from call_state import CallStateStore
+from call_status import CallStatusIngest
+from campaign_store import CampaignStore
+from dial_routing import DialRouter, HealthTracker
+from event_log import EventLog
+from ivr import compile_graph, menu_stats, render
+from ivr_tables import DEPARTMENTS, DIAL_PLANS, DOCTOR_MAP, IVR_GRAPH, LANGUAGES, TEST_MAP
+from metrics import init_app as init_metrics, observe_dial, observe_menu, observe_twilio_api, time_render
+from prompt_audio import PromptAudio
+from recordings import RecordingIngest
+from twiml_cache import TwimlCache, tables_version
 
 load_dotenv()
 
@@ -10,289 +23,283 @@ TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
 TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
 TWILIO_FROM_NUMBER = os.getenv("TWILIO_FROM_NUMBER")
 
-if not (TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN and TWILIO_FROM_NUMBER):
-    raise RuntimeError("Missing Twilio env vars. Set TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_FROM_NUMBER")
-
-client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+# TwiML response cache; set TWIML_CACHE_ENABLED=0 to render every request
+TWIML_CACHE_ENABLED = os.getenv("TWIML_CACHE_ENABLED", "1") != "0"
+TWIML_CACHE_SIZE = int(os.getenv("TWIML_CACHE_SIZE", "512"))
+# Outbound campaign dialer; TWILIO_API_BASE can point at a local fake of the REST API
+DIALER_WORKERS = int(os.getenv("DIALER_WORKERS", "8"))
+DIALER_CALLS_PER_SECOND = float(os.getenv("DIALER_CALLS_PER_SECOND", "1"))
+DIALER_MAX_RETRIES = int(os.getenv("DIALER_MAX_RETRIES", "3"))
+# Campaign progress and the DIALER_CALLS_PER_SECOND bucket are shared by every worker through this file;
+# empty keeps a campaign's progress in the worker that dials it and gives each worker the full rate.
+DIALER_DB = os.getenv("DIALER_DB", "dialer.db")
+# Recording callbacks are stored here and their audio downloaded in the background
+RECORDINGS_DB = os.getenv("RECORDINGS_DB", "recordings.db")
+RECORDINGS_DIR = os.getenv("RECORDINGS_DIR", "recordings")
+# Pre-synthesized prompts (python -m prompt_audio) are played instead of <Say> when present
+PROMPT_AUDIO_DIR = os.path.abspath(os.getenv("PROMPT_AUDIO_DIR", "prompt_audio"))
+PROMPT_AUDIO_ENABLED = os.getenv("PROMPT_AUDIO_ENABLED", "1") != "0"
+# Per-call state shared by all workers on the host; empty CALL_STATE_DB keeps it in-process only
+CALL_STATE_DB = os.getenv("CALL_STATE_DB", "call_state.db")
+CALL_STATE_TTL = int(os.getenv("CALL_STATE_TTL", "7200"))
+CALL_STATE_MAX_PATH = 32
+# Department dialing: recent outcomes kept per number to order the numbers by health
+DIAL_HEALTH_WINDOW = int(os.getenv("DIAL_HEALTH_WINDOW", "20"))
+DIAL_HEALTH_MAX_AGE = int(os.getenv("DIAL_HEALTH_MAX_AGE", "900"))
+# Status callbacks of campaign calls, aggregated per job for /make-call/<job_id>
+CALL_STATUS_DB = os.getenv("CALL_STATUS_DB", "call_status.db")
+# Every IVR webhook is logged to segments rotated every EVENT_LOG_ROTATE_SECONDS and rolled up into EVENT_LOG_DB for /stats
+EVENT_LOG_DIR = os.getenv("EVENT_LOG_DIR", "events")
+EVENT_LOG_DB = os.getenv("EVENT_LOG_DB", "events.db")
+EVENT_LOG_ROTATE_SECONDS = int(os.getenv("EVENT_LOG_ROTATE_SECONDS", "60"))
+# Async mode (see asgi.py): dial campaigns as coroutines over one shared async HTTP client
+ASYNC_MODE = os.getenv("ASYNC_MODE", "0") == "1"
+# If set, every menu document for this base URL is rendered at startup
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL")
+
+# Webhooks work without credentials; only outbound calls need them. The
+# warning about missing ones is logged once, by the gunicorn master (see
+# gunicorn.conf.py) or the dev server below, not by every worker.
+TWILIO_CONFIGURED = bool(TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN and TWILIO_FROM_NUMBER)
+
+# ---------------- Outbound dialer ----------------
+# Created on the first /make-call, so workers that only answer webhooks
+# never import the REST client stack or start its threads.
+dialer = None
+_dialer_lock = threading.Lock()
+
+def get_dialer():
+    global dialer
+    if dialer is None:
+        with _dialer_lock:
+            if dialer is None:
+                dialer = create_dialer()
+    return dialer
+
+def create_dialer():
+    from dialer import TWILIO_API_BASE
+
+    options = dict(
+        api_base=os.getenv("TWILIO_API_BASE", TWILIO_API_BASE),
+        max_workers=DIALER_WORKERS,
+        calls_per_second=DIALER_CALLS_PER_SECOND,
+        max_retries=DIALER_MAX_RETRIES,
+        observer=observe_twilio_api,
+        rate_db=DIALER_DB or None,
+        store=campaign_store,
+    )
+    if ASYNC_MODE:
+        from aio import AsyncRuntime
+        from dialer import AsyncDialer
+
+        runtime = AsyncRuntime()
+        atexit.register(runtime.close)
+        return AsyncDialer(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_FROM_NUMBER, runtime, **options)
+
+    from dialer import Dialer
+
+    return Dialer(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_FROM_NUMBER, **options)
+
+recording_ingest = RecordingIngest(RECORDINGS_DB, RECORDINGS_DIR,
+                                   auth=(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN) if TWILIO_CONFIGURED else None)
+atexit.register(recording_ingest.stop)
+call_state = CallStateStore(CALL_STATE_DB or None, ttl=CALL_STATE_TTL)
+call_status_ingest = CallStatusIngest(CALL_STATUS_DB)
+atexit.register(call_status_ingest.stop)
+campaign_store = CampaignStore(DIALER_DB) if DIALER_DB else None
+if campaign_store:
+    atexit.register(campaign_store.stop)
+event_log = EventLog(EVENT_LOG_DIR, EVENT_LOG_DB, rotate_seconds=EVENT_LOG_ROTATE_SECONDS,
+                     compact_interval=min(30, EVENT_LOG_ROTATE_SECONDS))
+atexit.register(event_log.stop)
 app = Flask(__name__)  # fixed
-
-DEPARTMENTS = {
-    "appointments": "+919999999999",
-    "emergency": "+911112223334",
-    "callback_owner": "+919888888888"
-}
-
-# Language texts
-LANGUAGES = {
-    "en": {
-        "welcome": "Welcome to HealthyCare Clinic. For English, press 1. For Hindi, press 2. For Marathi, press 3. To repeat this menu press 9.",
-        "no_input": "We did not receive any input. Goodbye.",
-        "invalid_selection": "Invalid selection. ",
-        "return_main": "No input received. Returning to main menu.",
-        "main_menu": "For appointment booking press 1. For emergency help press 2. For pathology tests press 3. To repeat this menu press 9.",
-        "appointment_menu": "For appointment booking. For Dental press 1. For General Doctor press 2. For Orthopaedic press 3. To repeat this menu press 9.",
-        "pathology_menu": "Pathology tests. For regular blood test press 1. For full body profile press 2. For heart check up press 3. To repeat this menu press 9.",
-        "emergency_connect": "Connecting you to emergency services. Please hold.",
-        "emergency_fail": "Unable to connect to emergency number. Goodbye.",
-        "appointment_thanks": "Thank you. You selected {}. Our team will call you soon to schedule a convenient time.",
-        "appointment_record": "If you would like to leave a short message with your preferred time or details, please record after the tone. Press hash when finished. To repeat the previous menu press 9.",
-        "pathology_thanks": "Thank you. You selected {}. Our staff will call you shortly to arrange an appointment and share instructions.",
-        "pathology_record": "If you want to leave a message for preferred timing, record after the tone. Press hash when finished. To repeat the previous menu press 9.",
-        "thankyou_goodbye": "Thank you. Goodbye.",
-        "recording_saved": "Your message has been recorded. We will contact you soon. Goodbye."
-    },
-    "hi": {
-        "welcome": "स्वागत है हेल्थीकेयर क्लिनिक में। अंग्रेजी के लिए, 1 दबाएं। हिंदी के लिए, 2 दबाएं। मराठी के लिए 3 दबाएं। इस मेनू को दोहराने के लिए 9 दबाएं।",
-        "no_input": "हमें कोई इनपुट प्राप्त नहीं हुआ। अलविदा।",
-        "invalid_selection": "अमान्य चयन। ",
-        "return_main": "कोई इनपुट प्राप्त नहीं हुआ। मुख्य मेनू पर वापस जा रहे हैं।",
-        "main_menu": "अपॉइंटमेंट बुकिंग के लिए 1 दबाएं। इमरजेंसी हेल्प के लिए 2 दबाएं। पैथोलॉजी टेस्ट के लिए 3 दबाएं। इस मेनू को दोहराने के लिए 9 दबाएं।",
-        "appointment_menu": "अपॉइंटमेंट बुकिंग के लिए। डेंटल के लिए 1 दबाएं। जनरल डॉक्टर के लिए 2 दबाएं। ऑर्थोपेडिक के लिए 3 दबाएं। इस मेनू को दोहराने के लिए 9 दबाएं।",
-        "pathology_menu": "पैथोलॉजी टेस्ट। रेगुलर ब्लड टेस्ट के लिए 1 दबाएं। फुल बॉडी प्रोफाइल के लिए 2 दबाएं। हार्ट चेक अप के लिए 3 दबाएं। इस मेनू को दोहराने के लिए 9 दबाएं।",
-        "emergency_connect": "आपको इमरजेंसी सर्विसेज से कनेक्ट किया जा रहा है। कृपया प्रतीक्षा करें।",
-        "emergency_fail": "इमरजेंसी नंबर से कनेक्ट नहीं हो पा रहे हैं। अलविदा।",
-        "appointment_thanks": "धन्यवाद। आपने {} चुना है। हमारी टीम जल्द ही आपको एक सुविधाजनक समय निर्धारित करने के लिए कॉल करेगी।",
-        "appointment_record": "यदि आप अपने पसंदीदा समय या विवरण के साथ एक छोटा संदेश छोड़ना चाहते हैं, कृपया टोन के बाद रिकॉर्ड करें। समाप्त करने पर हैश दबाएं। पिछले मेनू को दोहराने के लिए 9 दबाएं।",
-        "pathology_thanks": "धन्यवाद। आपने {} चुना है। हमारा स्टाफ जल्द ही आपके साथ एक अपॉइंटमेंट व्यवस्थित करने और निर्देश साझा करने के लिए कॉल करेगा।",
-        "pathology_record": "यदि आप पसंदीदा समय के लिए कोई संदेश छोड़ना चाहते हैं, टोन के बाद रिकॉर्ड करें। समाप्त करने पर हैश दबाएं। पिछले मेनू को दोहराने के लिए 9 दबाएं।",
-        "thankyou_goodbye": "धन्यवाद। अलविदा।",
-        "recording_saved": "आपका संदेश रिकॉर्ड कर लिया गया है। हम जल्द ही आपसे संपर्क करेंगे। अलविदा।"
-    },
-    # Marathi added (approximate translations)
-    "mr": {
-        "welcome": "हेल्थीकेअर क्लिनिकमध्ये आपले स्वागत आहे. इंग्रजीसाठी 1 दाबा. हिंदीसाठी 2 दाबा. मराठीसाठी 3 दाबा. हा मेनू पुन्हा ऐकण्यासाठी 9 दाबा.",
-        "no_input": "आपला इनपुट मिळाला नाही. अलविदा.",
-        "invalid_selection": "अवैध निवड. ",
-        "return_main": "कोणताही इनपुट मिळाला नाही. मुख्य मेन्यूकडे परत जात आहोत.",
-        "main_menu": "अपॉइंटमेंट बुक करण्यासाठी 1 दाबा. आपत्कालीन मदतीसाठी 2 दाबा. पॅथॉलॉजी चाचणीसाठी 3 दाबा. हा मेनू पुन्हा ऐकण्यासाठी 9 दाबा.",
-        "appointment_menu": "अपॉइंटमेंट बुकिंगसाठी. डेन्टल साठी 1 दाबा. जनरल डॉक्टर साठी 2 दाबा. अर्थोपेडिक साठी 3 दाबा. हा मेनू पुन्हा ऐकण्यासाठी 9 दाबा.",
-        "pathology_menu": "पॅथॉलॉजी टेस्ट. नियमित रक्त तपासणीसाठी 1 दाबा. फुल बॉडी प्रोफाइलसाठी 2 दाबा. हार्ट चेकअपसाठी 3 दाबा. हा मेनू पुन्हा ऐकण्यासाठी 9 दाबा.",
-        "emergency_connect": "आपल्याला आपत्कालीन सेवांशी जोडले जात आहे. कृपया थांबा.",
-        "emergency_fail": "आपत्कालीन नंबरशी कनेक्ट करता येत नाही. अलविदा.",
-        "appointment_thanks": "धन्यवाद. आपण {} निवडले. आमची टीम लवकरच आपल्याला कॉल करून वेळ ठरवेल.",
-        "appointment_record": "आपण आपला पसंतीचा वेळ किंवा तपशील सांगणारा छोटा संदेश ठेवू इच्छित असल्यास, टोननंतर रेकॉर्ड करा. पूर्ण झाल्यावर हैश दाबा. मागील मेनू पुन्हा ऐकण्यासाठी 9 दाबा.",
-        "pathology_thanks": "धन्यवाद. आपण {} निवडले. आमचे कर्मचारी लवकरच आपल्याशी संपर्क करेल.",
-        "pathology_record": "पसंत वेळेकरता संदेश ठेवायचा असल्यास, टोननंतर रेकॉर्ड करा. पूर्ण झाल्यावर हैश दाबा. मागील मेनू पुन्हा ऐकण्यासाठी 9 दाबा.",
-        "thankyou_goodbye": "धन्यवाद. अलविदा.",
-        "recording_saved": "आपला संदेश रेकॉर्ड केला गेला आहे. आम्ही लवकरच संपर्क करू. अलविदा."
-    }
-}
-
-# Doctor and test mappings in English, Hindi, Marathi
-DOCTOR_MAP = {
-    "en": {"1": "Dental", "2": "General Doctor", "3": "Orthopaedic"},
-    "hi": {"1": "डेंटल", "2": "जनरल डॉक्टर", "3": "ऑर्थोपेडिक"},
-    "mr": {"1": "डेन्टल", "2": "जनरल डॉक्टर", "3": "ऑर्थोपेडिक"}
-}
-
-TEST_MAP = {
-    "en": {"1": "regular blood test", "2": "full body profile", "3": "heart check up"},
-    "hi": {"1": "रेगुलर ब्लड टेस्ट", "2": "फुल बॉडी प्रोफाइल", "3": "हार्ट चेक अप"},
-    "mr": {"1": "नियमित रक्त तपासणी", "2": "फुल बॉडी प्रोफाइल", "3": "हार्ट चेकअप"}
-}
-
-def twiml_response(twiml):
-    return Response(str(twiml), mimetype="text/xml")
-
-def get_language(digits):
-    """Get language based on user selection"""
-    if digits == "1":
-        return "en"
-    elif digits == "2":
-        return "hi"
-    elif digits == "3":
-        return "mr"
-    return None
-
-# ---------------- Language Selection ----------------
-@app.route("/voice", methods=["POST", "GET"])
-def voice():
-    resp = VoiceResponse()
-    base = request.url_root.rstrip("/")
-
-    gather = Gather(num_digits=1, action=f"{base}/handle-language", method="POST", timeout=8)
-    # use language neutral prompt (twilio will use account default or TwiML language if set)
-    gather.say(LANGUAGES["en"]["welcome"])
-    resp.append(gather)
-
-    resp.say(LANGUAGES["en"]["no_input"])
-    resp.hangup()
-    return twiml_response(resp)
-
-@app.route("/handle-language", methods=["POST"])
-def handle_language():
-    digits = request.values.get("Digits", "")
-    resp = VoiceResponse()
-    base = request.url_root.rstrip("/")
-
-    # Repeat key handling
-    if digits == "9":
-        gather = Gather(num_digits=1, action=f"{base}/handle-language", method="POST", timeout=8)
-        gather.say(LANGUAGES["en"]["welcome"])
-        resp.append(gather)
-        resp.say(LANGUAGES["en"]["no_input"])
-        resp.hangup()
-        return twiml_response(resp)
-
-    lang = get_language(digits)
-    if lang:
-        # Proceed to main menu for the chosen language
-        gather = Gather(num_digits=1, action=f"{base}/handle-main?lang={lang}", method="POST", timeout=8)
-        gather.say(LANGUAGES[lang]["main_menu"])
-        resp.append(gather)
-        resp.say(LANGUAGES[lang]["return_main"])
-        resp.redirect(f"{base}/voice", method="POST")
-    else:
-        # invalid -> replay language menu
-        gather = Gather(num_digits=1, action=f"{base}/handle-language", method="POST", timeout=8)
-        resp.say(LANGUAGES["en"]["invalid_selection"] + "Please choose a language.")
-        gather.say(LANGUAGES["en"]["welcome"])
-        resp.append(gather)
-        resp.say(LANGUAGES["en"]["no_input"])
-        resp.hangup()
-
-    return twiml_response(resp)
-
-# ---------------- Handle main selection ----------------
-@app.route("/handle-main", methods=["POST"])
-def handle_main():
-    digits = request.values.get("Digits", "")
-    lang = request.args.get("lang", "en")  # Default to English
-    resp = VoiceResponse()
-    base = request.url_root.rstrip("/")
-
-    # Repeat current main menu
-    if digits == "9" or digits == "" :
-        gather = Gather(num_digits=1, action=f"{base}/handle-main?lang={lang}", method="POST", timeout=8)
-        gather.say(LANGUAGES[lang]["main_menu"])
-        resp.append(gather)
-        resp.say(LANGUAGES[lang]["return_main"])
-        resp.redirect(f"{base}/handle-language", method="POST")
-        return twiml_response(resp)
-
-    if digits == "1":
-        gather = Gather(num_digits=1, action=f"{base}/handle-appointment-doctor?lang={lang}", method="POST", timeout=8)
-        gather.say(LANGUAGES[lang]["appointment_menu"])
-        resp.append(gather)
-        resp.say(LANGUAGES[lang]["return_main"])
-        resp.redirect(f"{base}/handle-language", method="POST")
-        return twiml_response(resp)
-
-    elif digits == "2":
-        resp.say(LANGUAGES[lang]["emergency_connect"])
-        resp.dial(DEPARTMENTS["emergency"], timeout=30)
-        resp.say(LANGUAGES[lang]["emergency_fail"])
-        resp.hangup()
-        return twiml_response(resp)
-
-    elif digits == "3":
-        gather = Gather(num_digits=1, action=f"{base}/handle-pathology?lang={lang}", method="POST", timeout=8)
-        gather.say(LANGUAGES[lang]["pathology_menu"])
-        resp.append(gather)
-        resp.say(LANGUAGES[lang]["return_main"])
-        resp.redirect(f"{base}/handle-language", method="POST")
-        return twiml_response(resp)
-
-    else:
-        # invalid -> replay main menu (keeps same language)
-        gather = Gather(num_digits=1, action=f"{base}/handle-main?lang={lang}", method="POST", timeout=8)
-        resp.say(LANGUAGES[lang]["invalid_selection"] + LANGUAGES[lang]["main_menu"])
-        gather.say(LANGUAGES[lang]["main_menu"])
-        resp.append(gather)
-        resp.say(LANGUAGES[lang]["return_main"])
-        resp.redirect(f"{base}/handle-language", method="POST")
-        return twiml_response(resp)
-
-# ---------------- Appointment doctor handler ----------------
-@app.route("/handle-appointment-doctor", methods=["POST"])
-def handle_appointment_doctor():
-    digits = request.values.get("Digits", "")
-    lang = request.args.get("lang", "en")
-    resp = VoiceResponse()
-    base = request.url_root.rstrip("/")
-
-    # Repeat menu if 9 pressed
-    if digits == "9" or digits == "":
-        gather = Gather(num_digits=1, action=f"{base}/handle-appointment-doctor?lang={lang}", method="POST", timeout=8)
-        gather.say(LANGUAGES[lang]["appointment_menu"])
-        resp.append(gather)
-        resp.say(LANGUAGES[lang]["return_main"])
-        resp.redirect(f"{base}/handle-main?lang={lang}", method="POST")
-        return twiml_response(resp)
-
-    doc = DOCTOR_MAP[lang].get(digits)
-    if doc:
-        resp.say(LANGUAGES[lang]["appointment_thanks"].format(doc))
-        resp.say(LANGUAGES[lang]["appointment_record"])
-        resp.record(max_length=60, finish_on_key="#",
-                   action=f"{request.url_root.rstrip('/')}/handle-recording?type=appointment&doctor={doc}&lang={lang}",
-                   method="POST")
-        resp.say(LANGUAGES[lang]["thankyou_goodbye"])
-        resp.hangup()
-        return twiml_response(resp)
-    else:
-        # invalid -> replay appointment menu
-        gather = Gather(num_digits=1, action=f"{base}/handle-appointment-doctor?lang={lang}", method="POST", timeout=8)
-        resp.say(LANGUAGES[lang]["invalid_selection"] + LANGUAGES[lang]["appointment_menu"])
-        gather.say(LANGUAGES[lang]["appointment_menu"])
-        resp.append(gather)
-        resp.say(LANGUAGES[lang]["return_main"])
-        resp.redirect(f"{base}/handle-main?lang={lang}", method="POST")
-        return twiml_response(resp)
-
-# ---------------- Pathology handler ----------------
-@app.route("/handle-pathology", methods=["POST"])
-def handle_pathology():
-    digits = request.values.get("Digits", "")
-    lang = request.args.get("lang", "en")
-    resp = VoiceResponse()
-    base = request.url_root.rstrip("/")
-
-    # Repeat menu if 9 pressed
-    if digits == "9" or digits == "":
-        gather = Gather(num_digits=1, action=f"{base}/handle-pathology?lang={lang}", method="POST", timeout=8)
-        gather.say(LANGUAGES[lang]["pathology_menu"])
-        resp.append(gather)
-        resp.say(LANGUAGES[lang]["return_main"])
-        resp.redirect(f"{base}/handle-main?lang={lang}", method="POST")
-        return twiml_response(resp)
-
-    test = TEST_MAP[lang].get(digits)
-    if test:
-        resp.say(LANGUAGES[lang]["pathology_thanks"].format(test))
-        resp.say(LANGUAGES[lang]["pathology_record"])
-        resp.record(max_length=60, finish_on_key="#",
-                   action=f"{request.url_root.rstrip('/')}/handle-recording?type=pathology&test={test}&lang={lang}",
-                   method="POST")
-        resp.say(LANGUAGES[lang]["thankyou_goodbye"])
-        resp.hangup()
-        return twiml_response(resp)
-    else:
-        gather = Gather(num_digits=1, action=f"{base}/handle-pathology?lang={lang}", method="POST", timeout=8)
-        resp.say(LANGUAGES[lang]["invalid_selection"] + LANGUAGES[lang]["pathology_menu"])
-        gather.say(LANGUAGES[lang]["pathology_menu"])
-        resp.append(gather)
-        resp.say(LANGUAGES[lang]["return_main"])
-        resp.redirect(f"{base}/handle-main?lang={lang}", method="POST")
-        return twiml_response(resp)
+init_metrics(app)
+
+# ---------------- IVR menu graph ----------------
+# The graph and its prompt tables live in ivr_tables.py; the compiled table
+# is built at import, i.e. once in a --preload master.
+ivr_table = compile_graph(IVR_GRAPH, LANGUAGES)
+
+def compile_ivr():
+    global ivr_table
+    ivr_table = compile_graph(IVR_GRAPH, LANGUAGES)
+
+# ---------------- Prompt audio ----------------
+prompt_audio = PromptAudio(PROMPT_AUDIO_DIR)
+
+@app.route(f"{prompt_audio.route}/<path:name>", methods=["GET"])
+def prompt_audio_file(name):
+    # file names are content hashes, so a file never changes once published
+    resp = send_from_directory(PROMPT_AUDIO_DIR, name, max_age=365 * 24 * 3600, conditional=True)
+    resp.cache_control.immutable = True
+    return resp
+
+# ---------------- Dial routing ----------------
+# Departments ring an ordered list of numbers, healthiest first, either all
+# at once or one after another (see DIAL_PLANS). Every leg reports back to
+# /dial-status, which is what keeps the health tracker current.
+dial_numbers = {}
+dial_plans = {}
+for _name, _numbers in DEPARTMENTS.items():
+    _override = os.getenv(f"{_name.upper()}_NUMBERS")
+    dial_numbers[_name] = [n.strip() for n in _override.split(",") if n.strip()] if _override else list(_numbers)
+    dial_plans[_name] = dict(DIAL_PLANS.get(_name, {}))
+    if os.getenv(f"{_name.upper()}_DIAL_MODE"):
+        dial_plans[_name]["mode"] = os.getenv(f"{_name.upper()}_DIAL_MODE")
+dial_router = DialRouter(dial_numbers, dial_plans, HealthTracker(DIAL_HEALTH_WINDOW, DIAL_HEALTH_MAX_AGE))
+
+@app.route("/dial-status", methods=["POST"])
+def dial_status():
+    """Status callback of every dialed leg"""
+    leg_sid = request.values.get("CallSid")
+    status = request.values.get("CallStatus")
+    department = request.args.get("dept")
+    number = request.args.get("number") or request.values.get("To")
+    if not (leg_sid and number) or department not in dial_numbers:
+        return "", 204
+    now = time.time()
+    if status == "initiated":
+        call_state.put(leg_sid, {"dial_started_at": now})
+        return "", 204
+    leg = call_state.get(leg_sid) or {}
+    leg_seconds = now - leg["dial_started_at"] if "dial_started_at" in leg else None
+    outcome = dial_router.record(number, status, leg_seconds)
+    if outcome:
+        # what the caller waited: from their keypress, across every leg tried
+        parent_sid = request.values.get("ParentCallSid")
+        parent = (call_state.get(parent_sid) if parent_sid else None) or {}
+        time_to_answer = now - parent["dial_started_at"] if outcome == "answered" and "dial_started_at" in parent else None
+        observe_dial(department, outcome, time_to_answer)
+    return "", 204
+
+@app.route("/dial-health", methods=["GET"])
+def dial_health():
+    return jsonify(dial_router.snapshot())
+
+# ---------------- TwiML response cache ----------------
+# Every menu document depends only on (node, lang, keypress, base URL), so
+# each one is rendered once and served as bytes afterwards. A change to the
+# prompt tables recompiles the graph and drops the cache; so does a change
+# to the set of prompt audio files.
+twiml_cache = TwimlCache(
+    lambda: tables_version(LANGUAGES, DOCTOR_MAP, TEST_MAP, prompt_audio.version()),
+    max_entries=TWIML_CACHE_SIZE,
+    enabled=TWIML_CACHE_ENABLED,
+    on_change=compile_ivr,
+)
+
+def render_twiml(node, lang, key, steps, base, call_sid=None, state=None):
+    audio = (lambda lang, text: prompt_audio.url(base, lang, text)) if PROMPT_AUDIO_ENABLED else None
+
+    def dial(resp, department, timeout, action_url, numbers):
+        remaining = dial_router.append_dial(resp, department, timeout, action_url, f"{base}/dial-status", numbers)
+        if call_sid:
+            # the legs still to ring stay with the call for dial_failover, not in the action URL
+            call_state.put(call_sid, dict(state, dial={"dept": department, "timeout": timeout, "next": remaining}))
+
+    document = time_render(node.name, lambda: str(render(ivr_table, steps, base, lang, LANGUAGES, dial_numbers,
+                                                         audio=audio, dial=dial)).encode("utf-8"))
+    if any(step[0] == "dial" for step in steps):
+        # the ring order follows live number health, so these are never cached
+        return document()
+    return twiml_cache.get_or_render((node.name, lang, key, base), document)
 
 # ---------------- Recording callback ----------------
-@app.route("/handle-recording", methods=["POST"])
-def handle_recording():
+def ingest_recording(lang, state):
     recording_url = request.values.get("RecordingUrl")
     recording_sid = request.values.get("RecordingSid")
     duration = request.values.get("RecordingDuration")
     caller = request.values.get("From")
-    rtype = request.args.get("type")
-    extra = request.args.get("doctor") or request.args.get("test")
-    lang = request.args.get("lang", "en")
+    # what the caller picked is in the call state; the query string is only a fallback
+    selection = (state or {}).get("selection") or request.args
+    rtype = selection.get("type")
+    extra = selection.get("doctor") or selection.get("test")
+
+    if recording_sid:
+        recording_ingest.submit({
+            "recording_sid": recording_sid,
+            "call_sid": request.values.get("CallSid"),
+            "url": recording_url,
+            "duration": int(duration) if duration and duration.isdigit() else None,
+            "caller": caller,
+            "rtype": rtype,
+            "extra": extra,
+            "lang": lang,
+        })
+
+# ---------------- Dial failover ----------------
+def dial_failover(lang, state):
+    """Dial action callback: ring the next number after a missed leg"""
+    if request.values.get("DialCallStatus") in ("completed", "answered"):
+        return "answered", (("hangup",),)
+    pending = (state or {}).get("dial") or {}
+    remaining = tuple(pending.get("next") or ())
+    if remaining and pending.get("dept") in dial_numbers:
+        node = ivr_table.by_path[request.path]
+        return "failover", (("dial", pending["dept"], pending["timeout"], node.name, remaining),)
+    # every number was tried: fall through to the node's goodbye
+    return None
 
-    print(f"Received recording: sid={recording_sid}, url={recording_url}, duration={duration}, from={caller}, type={rtype}, extra={extra}, language={lang}")
+# Hooks run after the keypress is recorded; one may return (key, steps) to
+# answer with something other than the node's compiled steps
+IVR_HOOKS = {
+    "recording": ingest_recording,
+    "dial_failover": dial_failover,
+}
 
-    resp = VoiceResponse()
-    resp.say(LANGUAGES[lang]["recording_saved"])
-    resp.hangup()
-    return twiml_response(resp)
+# ---------------- Call state ----------------
+def advance_call_state(call_sid, state, node, lang, key, steps):
+    """Record the caller's language, selection and menu path after a keypress"""
+    now = time.time()
+    state = dict(state) if state else {"started_at": now, "path": []}
+    if not node.fixed_lang:
+        state["lang"] = lang
+    for step in steps:
+        if step[0] == "set_lang":
+            state["lang"] = step[1]
+        elif step[0] == "record":
+            state["selection"] = step[2]
+        elif step[0] == "dial" and len(step) == 4:
+            # first attempt at a department, later legs keep the original start
+            state["dial_started_at"] = now
+    state["path"] = (state["path"] + [[node.name, key, round(now - state["started_at"], 3)]])[-CALL_STATE_MAX_PATH:]
+    state["updated_at"] = now
+    call_state.put(call_sid, state)
+    return state
+
+# ---------------- IVR dispatch ----------------
+def ivr_dispatch():
+    started = time.perf_counter()
+    twiml_cache.check_version()
+    node = ivr_table.by_path[request.path]
+    digits = request.values.get("Digits", "")
+    call_sid = request.values.get("CallSid")
+    state = call_state.get(call_sid) if call_sid else None
+    # the stored language wins over the one echoed back in the URL
+    lang = (state or {}).get("lang") or request.args.get("lang", "en")
+    lang, key, steps = ivr_table.lookup(node, lang, digits)
+    if call_sid:
+        state = advance_call_state(call_sid, state, node, lang, key, steps)
+    if node.hook:
+        override = IVR_HOOKS[node.hook](lang, state)
+        if override is not None:
+            key, steps = override
+    observe_menu(node.name, lang, digits, key)
+    body = render_twiml(node, lang, key, steps, request.url_root.rstrip("/"), call_sid, state)
+    event_log.append(call_sid, node.name, digits, lang, key, (time.perf_counter() - started) * 1000,
+                     (state or {}).get("lang"))
+    return Response(body, mimetype="text/xml")
+
+for _name, _spec in IVR_GRAPH.items():
+    app.add_url_rule(_spec["path"], endpoint=f"ivr_{_name}", view_func=ivr_dispatch, methods=_spec.get("methods", ["POST"]))
+
+def warm_twiml_cache(base):
+    """Render every compiled menu document for base up front"""
+    base = base.rstrip("/")
+    for (name, lang), row in ivr_table.rows.items():
+        node = ivr_table.nodes[name]
+        for key, steps in row.items():
+            render_twiml(node, lang, key, steps, base)
 
 @app.route("/make-call", methods=["POST"])
 def make_call():
@@ -302,27 +309,75 @@ def make_call():
 
     if not to:
         return jsonify({"error": "missing 'to' field"}), 400
+    if not TWILIO_CONFIGURED:
+        return jsonify({"error": "outbound calls are not configured, set the Twilio env vars"}), 503
 
     numbers = to if isinstance(to, list) else [to]
-    results = []
-
-    for n in numbers:
-        try:
-            call = client.calls.create(
-                url=twiml_url,
-                to=n,
-                from_=TWILIO_FROM_NUMBER
-            )
-            results.append({"to": n, "status": "queued", "sid": call.sid})
-        except Exception as e:
-            results.append({"to": n, "status": "error", "error": str(e)})
-
-    return jsonify(results)
+    job = get_dialer().submit(numbers, twiml_url, status_callback=request.url_root.rstrip("/") + "/call-status")
+    data = job.to_dict(include_results=False)
+    data["status_url"] = f"{request.url_root.rstrip('/')}/make-call/{job.id}"
+    return jsonify(data), 202
+
+@app.route("/make-call/<job_id>", methods=["GET"])
+def make_call_status(job_id):
+    # progress and outcomes come from the shared stores, so any worker can answer for them
+    outcomes = call_status_ingest.stats(job_id)
+    if dialer:
+        data = dialer.load(job_id)
+    else:
+        data = campaign_store.load(job_id) if campaign_store else None
+    if data is None:
+        if outcomes is None:
+            return jsonify({"error": "unknown job id"}), 404
+        return jsonify({"job_id": job_id, "outcomes": outcomes})
+    data["outcomes"] = outcomes
+    if outcomes:
+        for leg in call_status_ingest.number_status(job_id):
+            if leg["index"] < len(data["results"]):
+                data["results"][leg["index"]].update(call_status=leg["status"], duration=leg["duration"])
+    return jsonify(data)
+
+@app.route("/call-status", methods=["POST"])
+def call_status():
+    """Status callback of every campaign call, see Dialer.call_params"""
+    job_id = request.args.get("job")
+    index = request.args.get("i", "")
+    duration = request.values.get("CallDuration", "")
+    if job_id and index.isdigit():
+        call_status_ingest.submit(job_id, int(index), request.values.get("CallSid"), request.values.get("To"),
+                                  request.values.get("CallStatus"), int(duration) if duration.isdigit() else None)
+    return "", 204
 
 # Test endpoint to verify all language texts
 @app.route("/test-languages", methods=["GET"])
 def test_languages():
     return jsonify(LANGUAGES)
 
+@app.route("/stats", methods=["GET"])
+def ivr_stats():
+    """Caller behaviour over the last ?hours= (default 24) or ?days=, from the hourly roll-ups"""
+    try:
+        hours = float(request.args["days"]) * 24 if "days" in request.args else float(request.args.get("hours", 24))
+    except ValueError:
+        return jsonify({"error": "hours and days must be numbers"}), 400
+    if not (math.isfinite(hours) and hours > 0):
+        return jsonify({"error": "hours and days must be positive and finite"}), 400
+    until = time.time()
+    # nothing is stored before the oldest day, so longer ranges stop there
+    oldest = event_log.oldest()
+    since = max(until - hours * 3600, until if oldest is None else oldest)
+    data = menu_stats(ivr_table, event_log.totals(since, until), event_log.calls(since, until))
+    data.update(since=since, until=until)
+    return jsonify(data)
+
+@app.route("/twiml-cache", methods=["GET"])
+def twiml_cache_stats():
+    return jsonify(twiml_cache.stats())
+
+if PUBLIC_BASE_URL and TWIML_CACHE_ENABLED:
+    warm_twiml_cache(PUBLIC_BASE_URL)
+
 if __name__ == "__main__":
+    if not TWILIO_CONFIGURED:
+        print("Missing Twilio env vars. Set TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_FROM_NUMBER to enable /make-call")
     app.run(host="0.0.0.0", port=5000, debug=True)
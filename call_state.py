@@ -0,0 +1,102 @@
+import json
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from sqlite_store import ThreadConnections
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS call_state (
+    call_sid TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    expires_at REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS call_state_expiry ON call_state (expires_at);
+"""
+
+
+class _Shard:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+
+class CallStateStore:
+    """Per-call state keyed by Twilio CallSid.
+
+    Two tiers: a sharded in-process LRU with TTL, and a SQLite file (WAL)
+    shared by every worker on the host. Each write gets a new version; a
+    read sends the locally cached version along and only decodes the shared
+    row when another worker has written a newer one. Shards have their own
+    locks and every thread has its own SQLite connection, so there is no
+    process-wide lock on the hot path.
+    """
+
+    def __init__(self, db_path=None, ttl=7200, max_local=10000, shards=16, purge_every=60):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_local_per_shard = max(1, max_local // shards)
+        self.purge_every = purge_every
+        self._shards = [_Shard() for _ in range(shards)]
+        self._conn = ThreadConnections(db_path, timeout=10) if db_path else None
+        self._next_purge = time.monotonic() + purge_every
+        if db_path:
+            self._conn().executescript(SCHEMA)
+
+    def _shard(self, call_sid):
+        return self._shards[zlib.crc32(call_sid.encode()) % len(self._shards)]
+
+    def get(self, call_sid):
+        """Return the state dict for call_sid or None; callers must not mutate it"""
+        now = time.time()
+        shard = self._shard(call_sid)
+        with shard.lock:
+            entry = shard.entries.get(call_sid)
+            if entry is not None and entry[1] < now:
+                del shard.entries[call_sid]
+                entry = None
+        if not self.db_path:
+            return entry[2] if entry else None
+
+        local_version = entry[0] if entry else -1
+        row = self._conn().execute(
+            "SELECT version, expires_at, data FROM call_state WHERE call_sid = ? AND version != ?",
+            (call_sid, local_version),
+        ).fetchone()
+        if row is None:
+            return entry[2] if entry else None
+        version, expires_at, data = row
+        if expires_at < now:
+            return None
+        state = json.loads(data)
+        self._put_local(shard, call_sid, (version, expires_at, state))
+        return state
+
+    def put(self, call_sid, state):
+        expires_at = time.time() + self.ttl
+        version = time.time_ns()
+        if self.db_path:
+            self._conn().execute(
+                "INSERT INTO call_state (call_sid, version, expires_at, data) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(call_sid) DO UPDATE SET version = excluded.version, "
+                "expires_at = excluded.expires_at, data = excluded.data",
+                (call_sid, version, expires_at, json.dumps(state, ensure_ascii=False, separators=(",", ":"))),
+            )
+            self._maybe_purge()
+        self._put_local(self._shard(call_sid), call_sid, (version, expires_at, state))
+
+    def _put_local(self, shard, call_sid, entry):
+        with shard.lock:
+            shard.entries[call_sid] = entry
+            shard.entries.move_to_end(call_sid)
+            while len(shard.entries) > self.max_local_per_shard:
+                shard.entries.popitem(last=False)
+
+    def _maybe_purge(self):
+        now = time.monotonic()
+        if now < self._next_purge:
+            return
+        self._next_purge = now + self.purge_every
+        self._conn().execute("DELETE FROM call_state WHERE expires_at < ?", (time.time(),))
@@ -0,0 +1,173 @@
+import sqlite3
+import threading
+import time
+from collections import deque
+
+from sqlite_store import ProcessThreads, ThreadConnections, connect
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS call_status (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    call_sid TEXT,
+    number TEXT,
+    status TEXT NOT NULL,
+    rank INTEGER NOT NULL,
+    duration INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (job_id, idx)
+);
+CREATE TABLE IF NOT EXISTS campaign_stats (
+    job_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    calls INTEGER NOT NULL,
+    duration INTEGER NOT NULL,
+    PRIMARY KEY (job_id, status)
+);
+"""
+
+# Twilio call statuses in the order a call moves through them; a late or
+# repeated callback never moves a call backwards
+STATUS_RANK = {
+    "queued": 0, "initiated": 1, "ringing": 2, "in-progress": 3,
+    "completed": 4, "busy": 4, "no-answer": 4, "failed": 4, "canceled": 4,
+}
+ANSWERED = ("in-progress", "completed")
+
+
+class CallStatusIngest:
+    """Status callbacks of campaign calls, aggregated per job.
+
+    submit() appends the event to a deque, which needs no lock of its own,
+    so the webhook returns right away. A flusher thread drains it every
+    flush_interval, keeps only the furthest status per (job, number) and
+    writes the batch in one transaction, folding in what arrives while a
+    failed write is retried. The same transaction moves each call between
+    the per-job counters in campaign_stats, so stats() reads a handful of
+    rows however many events a campaign produced. The SQLite file is shared
+    by every worker on the host.
+    """
+
+    def __init__(self, db_path, flush_interval=0.2):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.buffer = deque()
+        self._conn = ThreadConnections(db_path)
+        self._threads = ProcessThreads(("call-status-flusher", self._flusher))
+        self._stopping = threading.Event()
+        self._flushed = threading.Event()
+
+        conn = connect(db_path)
+        conn.executescript(SCHEMA)
+        conn.close()
+
+    def submit(self, job_id, index, call_sid, number, status, duration=None):
+        if status not in STATUS_RANK:
+            return
+        self._threads.ensure_started()
+        self.buffer.append((job_id, index, call_sid, number, status, duration or 0, time.time()))
+
+    def _flusher(self):
+        conn = connect(self.db_path)
+        while not self._stopping.is_set():
+            self._stopping.wait(self.flush_interval)
+            self._flush(conn)
+        self._flush(conn)
+        self._flushed.set()
+        conn.close()
+
+    def _flush(self, conn):
+        updates = {}
+        while True:
+            # while the store refuses the batch, later callbacks are folded into
+            # it, so memory is bounded by the calls, not by the callbacks
+            self._drain(updates)
+            if not updates:
+                return
+            try:
+                self._apply(conn, updates.values())
+                return
+            except sqlite3.Error as e:
+                print(f"Call status batch write failed, retrying: {e}")
+                if self._stopping.wait(1):
+                    return
+
+    def _drain(self, updates):
+        """Move buffered events into updates, keeping the furthest status per (job, number)"""
+        while True:
+            try:
+                event = self.buffer.popleft()
+            except IndexError:
+                return
+            key = event[:2]
+            current = updates.get(key)
+            if current is None or STATUS_RANK[event[4]] > STATUS_RANK[current[4]]:
+                updates[key] = event
+
+    def _apply(self, conn, events):
+        deltas = {}
+
+        def move(job_id, status, calls, duration):
+            calls_duration = deltas.setdefault((job_id, status), [0, 0])
+            calls_duration[0] += calls
+            calls_duration[1] += duration
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for job_id, index, call_sid, number, status, duration, updated_at in events:
+                old = conn.execute(
+                    "SELECT status, rank, duration FROM call_status WHERE job_id = ? AND idx = ?", (job_id, index),
+                ).fetchone()
+                if old is not None:
+                    if STATUS_RANK[status] <= old[1]:
+                        continue
+                    move(job_id, old[0], -1, -old[2])
+                move(job_id, status, 1, duration)
+                conn.execute(
+                    "INSERT INTO call_status (job_id, idx, call_sid, number, status, rank, duration, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(job_id, idx) DO UPDATE SET "
+                    "call_sid = excluded.call_sid, number = excluded.number, status = excluded.status, "
+                    "rank = excluded.rank, duration = excluded.duration, updated_at = excluded.updated_at",
+                    (job_id, index, call_sid, number, status, STATUS_RANK[status], duration, updated_at),
+                )
+            conn.executemany(
+                "INSERT INTO campaign_stats (job_id, status, calls, duration) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(job_id, status) DO UPDATE SET calls = calls + excluded.calls, "
+                "duration = duration + excluded.duration",
+                [(job_id, status, calls, duration) for (job_id, status), (calls, duration) in deltas.items()],
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def stats(self, job_id):
+        """Live outcome counts and talk time of one campaign, or None before its first callback"""
+        rows = self._conn().execute(
+            "SELECT status, calls, duration FROM campaign_stats WHERE job_id = ? AND calls > 0", (job_id,),
+        ).fetchall()
+        if not rows:
+            return None
+        counts = {status: calls for status, calls, _ in rows}
+        talk_seconds = sum(duration for _, _, duration in rows)
+        completed = counts.get("completed", 0)
+        return {
+            "counts": counts,
+            "answered": sum(counts.get(s, 0) for s in ANSWERED),
+            "talk_seconds": talk_seconds,
+            "avg_talk_seconds": round(talk_seconds / completed, 1) if completed else None,
+        }
+
+    def number_status(self, job_id):
+        """Latest status of every number of a campaign that has reported back"""
+        rows = self._conn().execute(
+            "SELECT idx, number, call_sid, status, duration FROM call_status WHERE job_id = ? ORDER BY idx",
+            (job_id,),
+        ).fetchall()
+        return [{"index": i, "to": n, "sid": sid, "status": s, "duration": d} for i, n, sid, s, d in rows]
+
+    def stop(self, timeout=5):
+        """Write out buffered events and stop the flusher"""
+        self._stopping.set()
+        if self._threads.running():
+            self._flushed.wait(timeout)
@@ -0,0 +1,154 @@
+import sqlite3
+import threading
+import time
+
+from sqlite_store import ProcessThreads, ThreadConnections, connect
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS campaigns (
+    job_id TEXT PRIMARY KEY,
+    twiml_url TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS campaigns_created ON campaigns (created_at);
+CREATE TABLE IF NOT EXISTS campaign_numbers (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    number TEXT NOT NULL,
+    status TEXT NOT NULL,
+    sid TEXT,
+    attempts INTEGER NOT NULL,
+    error TEXT,
+    PRIMARY KEY (job_id, idx)
+);
+"""
+
+
+class CampaignStore:
+    """Campaign jobs and the dialing progress of every number, shared by all workers.
+
+    A job is dialed by the worker that accepted it; add() and update()
+    only note what changed, and a flusher thread writes the latest row of
+    every changed number every flush_interval, so any worker can answer
+    load() for it. Pending changes are keyed by (job, number), so memory
+    stays bounded while the store refuses writes. Numbers a worker had not
+    dialed when it died stay "pending". Jobs are kept for retention_days.
+    """
+
+    def __init__(self, db_path, flush_interval=0.2, retention_days=7):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        # job_id -> (twiml_url, total, created_at, finished_at), (job_id, index) -> result row
+        self._jobs = {}
+        self._rows = {}
+        self._lock = threading.Lock()
+        self._conn = ThreadConnections(db_path)
+        self._threads = ProcessThreads(("campaign-flusher", self._flusher))
+        self._stopping = threading.Event()
+        self._flushed = threading.Event()
+
+        conn = connect(db_path)
+        conn.executescript(SCHEMA)
+        conn.close()
+
+    def add(self, job):
+        self._threads.ensure_started()
+        data = job.to_dict()
+        with self._lock:
+            self._jobs[job.id] = (job.twiml_url, data["total"], data["created_at"], data["finished_at"])
+            for index, row in enumerate(data["results"]):
+                self._rows[(job.id, index)] = row
+
+    def update(self, job, index, row):
+        """Called by the job, under its lock, with a copy of the number's row"""
+        with self._lock:
+            self._jobs[job.id] = (job.twiml_url, len(job.results), job.created_at, job.finished_at)
+            self._rows[(job.id, index)] = row
+
+    def _flusher(self):
+        conn = connect(self.db_path)
+        while not self._stopping.is_set():
+            self._stopping.wait(self.flush_interval)
+            self._flush(conn)
+        self._flush(conn)
+        self._flushed.set()
+        conn.close()
+
+    def _flush(self, conn):
+        while True:
+            with self._lock:
+                jobs, rows = self._jobs, self._rows
+                self._jobs, self._rows = {}, {}
+            if not jobs:
+                return
+            try:
+                self._apply(conn, jobs, rows)
+                return
+            except sqlite3.Error as e:
+                print(f"Campaign progress write failed, retrying: {e}")
+                with self._lock:
+                    # whatever changed meanwhile is newer than the batch
+                    self._jobs = {**jobs, **self._jobs}
+                    self._rows = {**rows, **self._rows}
+                if self._stopping.wait(1):
+                    return
+
+    def _apply(self, conn, jobs, rows):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO campaigns (job_id, twiml_url, total, created_at, finished_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(job_id) DO UPDATE SET finished_at = excluded.finished_at",
+                [(job_id,) + job for job_id, job in jobs.items()],
+            )
+            conn.executemany(
+                "INSERT INTO campaign_numbers (job_id, idx, number, status, sid, attempts, error) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(job_id, idx) DO UPDATE SET status = excluded.status, "
+                "sid = excluded.sid, attempts = excluded.attempts, error = excluded.error",
+                [(job_id, index, r["to"], r["status"], r["sid"], r["attempts"], r["error"])
+                 for (job_id, index), r in rows.items()],
+            )
+            cutoff = time.time() - self.retention_days * 86400
+            conn.execute("DELETE FROM campaign_numbers WHERE job_id IN "
+                         "(SELECT job_id FROM campaigns WHERE created_at < ?)", (cutoff,))
+            conn.execute("DELETE FROM campaigns WHERE created_at < ?", (cutoff,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def load(self, job_id, include_results=True):
+        """The job as CampaignJob.to_dict() shows it, or None if no worker stored it"""
+        conn = self._conn()
+        job = conn.execute("SELECT total, created_at, finished_at FROM campaigns WHERE job_id = ?",
+                           (job_id,)).fetchone()
+        if job is None:
+            return None
+        total, created_at, finished_at = job
+        counts = dict(conn.execute("SELECT status, COUNT(*) FROM campaign_numbers WHERE job_id = ? GROUP BY status",
+                                   (job_id,)).fetchall())
+        data = {
+            "job_id": job_id,
+            "state": "done" if finished_at is not None else "running",
+            "total": total,
+            "counts": counts,
+            "created_at": created_at,
+            "finished_at": finished_at,
+        }
+        if include_results:
+            rows = conn.execute(
+                "SELECT number, status, sid, attempts, error FROM campaign_numbers WHERE job_id = ? ORDER BY idx",
+                (job_id,),
+            ).fetchall()
+            data["results"] = [{"to": n, "status": s, "sid": sid, "attempts": a, "error": e}
+                               for n, s, sid, a, e in rows]
+        return data
+
+    def stop(self, timeout=5):
+        """Write out pending changes and stop the flusher"""
+        self._stopping.set()
+        if self._threads.running():
+            self._flushed.wait(timeout)
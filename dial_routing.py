@@ -0,0 +1,128 @@
+import statistics
+import threading
+import time
+from collections import deque
+from urllib.parse import urlencode
+
+from twilio.twiml.voice_response import Dial
+
+SIMULTANEOUS = "simultaneous"
+SEQUENTIAL = "sequential"
+
+# Final statuses of a leg that did not reach anyone; "canceled" is left out
+# because it is what the losing legs of a simultaneous ring end with
+MISSED_STATUSES = frozenset({"busy", "no-answer", "failed"})
+
+
+class HealthTracker:
+    """Recent answer rate and time-to-answer per phone number.
+
+    Keeps the last `window` outcomes of every number, ignoring those older
+    than max_age so a line that was down is tried first again once it has
+    been quiet for a while. Lives in process memory: every worker learns
+    from the status callbacks it happens to receive.
+    """
+
+    def __init__(self, window=20, max_age=900, expected_answer=8.0):
+        self.window = window
+        self.max_age = max_age
+        self.expected_answer = expected_answer
+        self._outcomes = {}
+        self._lock = threading.Lock()
+
+    def record(self, number, answered, seconds=None):
+        with self._lock:
+            outcomes = self._outcomes.get(number)
+            if outcomes is None:
+                outcomes = self._outcomes[number] = deque(maxlen=self.window)
+            outcomes.append((time.monotonic(), answered, seconds))
+
+    def health(self, number):
+        """(answer_rate, median seconds to answer, samples) over the recent window"""
+        cutoff = time.monotonic() - self.max_age
+        with self._lock:
+            recent = [o for o in self._outcomes.get(number, ()) if o[0] >= cutoff]
+        if not recent:
+            return 1.0, self.expected_answer, 0
+        answered = [s for _, ok, s in recent if ok]
+        latencies = [s for s in answered if s is not None]
+        # one imagined answered call keeps a single miss from burying a number
+        rate = (len(answered) + 1) / (len(recent) + 1)
+        return rate, statistics.median(latencies) if latencies else self.expected_answer, len(recent)
+
+    def cost(self, number, leg_timeout):
+        """Expected seconds lost by trying number first"""
+        rate, answer_seconds, _ = self.health(number)
+        return answer_seconds + (1 - rate) * leg_timeout
+
+    def snapshot(self, numbers):
+        data = {}
+        for number in numbers:
+            rate, answer_seconds, samples = self.health(number)
+            data[number] = {"answer_rate": round(rate, 3), "median_answer_seconds": round(answer_seconds, 2),
+                            "samples": samples}
+        return data
+
+
+class DialRouter:
+    """Builds the <Dial> for a department from its ordered numbers.
+
+    numbers maps department -> configured numbers, plans maps department ->
+    {"mode": "simultaneous" | "sequential", "leg_timeout": seconds}. In
+    simultaneous mode every number rings at once for the dial timeout; in
+    sequential mode one number rings for leg_timeout seconds, the last one
+    for the full timeout, and the caller keeps the rest to ring from the
+    Dial action callback. Either way the healthiest numbers come first,
+    with ties kept in configured order.
+    """
+
+    def __init__(self, numbers, plans, tracker):
+        for department, plan in plans.items():
+            if plan.get("mode", SIMULTANEOUS) not in (SIMULTANEOUS, SEQUENTIAL):
+                raise ValueError(f"Unknown dial mode {plan['mode']!r} for {department}")
+        self.numbers = numbers
+        self.plans = plans
+        self.tracker = tracker
+
+    def plan(self, department):
+        plan = self.plans.get(department, {})
+        return plan.get("mode", SIMULTANEOUS), plan.get("leg_timeout", 10)
+
+    def order(self, department):
+        _, leg_timeout = self.plan(department)
+        return sorted(self.numbers[department], key=lambda n: self.tracker.cost(n, leg_timeout))
+
+    def append_dial(self, resp, department, timeout, action_url, status_url, numbers=None):
+        """Append one attempt at department to resp and return the numbers left to try after it.
+
+        numbers overrides the health order.
+        """
+        mode, leg_timeout = self.plan(department)
+        numbers = list(numbers) if numbers is not None else self.order(department)
+        remaining = []
+        if mode == SEQUENTIAL:
+            numbers, remaining = numbers[:1], numbers[1:]
+            if remaining:
+                # short legs while there is somewhere left to fail over to
+                timeout = min(leg_timeout, timeout)
+        dial = Dial(timeout=timeout, action=action_url, method="POST")
+        for number in numbers:
+            dial.number(number, status_callback=f"{status_url}?{urlencode({'dept': department, 'number': number})}",
+                        status_callback_event="initiated answered completed", status_callback_method="POST")
+        resp.append(dial)
+        return remaining
+
+    def record(self, number, status, seconds):
+        """Feed one leg status callback into the tracker; returns the outcome or None"""
+        if status == "in-progress":
+            self.tracker.record(number, True, seconds)
+            return "answered"
+        if status in MISSED_STATUSES:
+            self.tracker.record(number, False, seconds)
+            return status
+        return None
+
+    def snapshot(self):
+        return {dept: {"mode": self.plan(dept)[0], "order": self.order(dept),
+                       "health": self.tracker.snapshot(numbers)}
+                for dept, numbers in self.numbers.items()}
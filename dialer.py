@@ -0,0 +1,379 @@
+import asyncio
+import base64
+import itertools
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from sqlite_store import ThreadConnections, connect
+
+TWILIO_API_BASE = "https://api.twilio.com"
+
+# Twilio answers these with "try again later"; everything else is final
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Numbers end up queued, error, or unknown when the request may have reached
+# Twilio but no answer came back, so the call may or may not have been placed
+FINAL_STATUSES = ("queued", "error", "unknown")
+
+# Call progress events sent to a job's status callback
+STATUS_CALLBACK_EVENTS = ("initiated", "ringing", "answered", "completed")
+
+RATE_LIMIT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_limit (
+    bucket TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+class RateLimiter:
+    """Token bucket shared by all dialer threads"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token and return how many seconds to wait before using it"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate)
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+
+
+class SharedRateLimiter(RateLimiter):
+    """Token bucket kept in a SQLite file, shared by every process on the host.
+
+    Twilio limits call creation per account, so all gunicorn workers draw
+    from one bucket per account instead of each getting the full rate.
+    """
+
+    def __init__(self, db_path, rate, burst=1, bucket="calls"):
+        super().__init__(rate, burst)
+        self.bucket = bucket
+        self._conn = ThreadConnections(db_path)
+        conn = connect(db_path)
+        conn.executescript(RATE_LIMIT_SCHEMA)
+        conn.close()
+
+    def reserve(self):
+        conn = self._conn()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # wall clock, since the bucket is shared between processes
+                now = time.time()
+                row = conn.execute("SELECT tokens, updated_at FROM rate_limit WHERE bucket = ?",
+                                   (self.bucket,)).fetchone()
+                tokens = self.burst if row is None else min(self.burst, row[0] + max(0.0, now - row[1]) * self.rate)
+                tokens -= 1
+                conn.execute(
+                    "INSERT INTO rate_limit (bucket, tokens, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(bucket) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at",
+                    (self.bucket, tokens, now),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            # better to keep dialing at this process's own pace than to drop the call
+            print(f"Shared rate limiter unavailable, pacing this process alone: {e}")
+            return super().reserve()
+        return max(0.0, -tokens / self.rate)
+
+
+class CampaignJob:
+    """Numbers of one campaign and how dialing each went.
+
+    store, if given, is told about every change (see CampaignStore).
+    """
+
+    def __init__(self, numbers, twiml_url, status_callback=None, store=None):
+        self.id = uuid.uuid4().hex
+        self.twiml_url = twiml_url
+        self.status_callback = status_callback
+        self.created_at = time.time()
+        self.finished_at = None
+        self.results = [{"to": n, "status": "pending", "sid": None, "attempts": 0, "error": None} for n in numbers]
+        self._remaining = len(numbers)
+        self._lock = threading.Lock()
+        self.store = store
+        if store:
+            store.add(self)
+
+    def update(self, index, **fields):
+        with self._lock:
+            self.results[index].update(fields)
+            if fields.get("status") in FINAL_STATUSES:
+                self._remaining -= 1
+                if self._remaining == 0:
+                    self.finished_at = time.time()
+            if self.store:
+                self.store.update(self, index, dict(self.results[index]))
+
+    def status_url(self, index):
+        """Where Twilio reports the progress of the call to number index"""
+        if not self.status_callback:
+            return None
+        return f"{self.status_callback}?{urlencode({'job': self.id, 'i': index})}"
+
+    def to_dict(self, include_results=True):
+        with self._lock:
+            counts = {}
+            for r in self.results:
+                counts[r["status"]] = counts.get(r["status"], 0) + 1
+            data = {
+                "job_id": self.id,
+                "state": "done" if self._remaining == 0 else "running",
+                "total": len(self.results),
+                "counts": counts,
+                "created_at": self.created_at,
+                "finished_at": self.finished_at,
+            }
+            if include_results:
+                data["results"] = [dict(r) for r in self.results]
+            return data
+
+
+class _DialerBase:
+    """Jobs, rate limit and retry policy shared by Dialer and AsyncDialer.
+
+    observer, if given, is called as observer(elapsed, status, error) after
+    every REST attempt. calls_per_second is shared by every process that
+    passes the same rate_db; without one each process has its own bucket.
+    A job is dialed by the process that accepted it. With a store its
+    progress is written there, so other processes can load() it; a restart
+    still drops the numbers that process had not dialed yet.
+    """
+
+    def __init__(self, account_sid, auth_token, from_number, api_base=TWILIO_API_BASE,
+                 max_workers=8, calls_per_second=1.0, max_retries=3, backoff=0.5,
+                 timeout=10, max_jobs=1000, observer=None, rate_db=None, store=None):
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self.from_number = from_number
+        self.calls_url = f"{api_base.rstrip('/')}/2010-04-01/Accounts/{account_sid}/Calls.json"
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.max_jobs = max_jobs
+        self.observer = observer
+        self.store = store
+        if rate_db:
+            self.limiter = SharedRateLimiter(rate_db, calls_per_second, bucket=f"calls:{account_sid}")
+        else:
+            self.limiter = RateLimiter(calls_per_second)
+        self._jobs = OrderedDict()
+        self._jobs_lock = threading.Lock()
+
+    def _register(self, job):
+        with self._jobs_lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+        return job
+
+    def get(self, job_id):
+        with self._jobs_lock:
+            return self._jobs.get(job_id)
+
+    def load(self, job_id, include_results=True):
+        """The job's to_dict(), from this process or the store; None if unknown"""
+        job = self.get(job_id)
+        if job is not None:
+            return job.to_dict(include_results)
+        return self.store.load(job_id, include_results) if self.store else None
+
+    def call_params(self, to, twiml_url, status_url=None):
+        params = [("To", to), ("From", self.from_number), ("Url", twiml_url)]
+        if status_url:
+            params += [("StatusCallback", status_url), ("StatusCallbackMethod", "POST")]
+            params += [("StatusCallbackEvent", event) for event in STATUS_CALLBACK_EVENTS]
+        return params
+
+    def _start_attempt(self, job, index, attempt):
+        job.update(index, attempts=attempt)
+        return time.perf_counter()
+
+    def _settle(self, job, index, attempt, started, response=None, error=None, sent=True):
+        """Record one REST attempt; returns seconds to wait before retrying, or None once the number is done.
+
+        response is (http_status, json_body, retry_after); error is the
+        exception raised instead when no response came back, and sent
+        whether the request may have reached Twilio before it was raised.
+        """
+        if error is not None:
+            self._observe(started, None, error)
+            message, retry_after = str(error) or type(error).__name__, None
+            if sent:
+                # Twilio may have created the call already, and another attempt would ring the number twice
+                job.update(index, status="unknown", error=message)
+                return None
+        else:
+            status, body, retry_after = response
+            self._observe(started, status, None)
+            if status < 300 and body and body.get("sid"):
+                job.update(index, status="queued", sid=body["sid"], error=None)
+                return None
+            message = (body or {}).get("message") or f"HTTP {status}"
+            if status not in RETRY_STATUSES:
+                attempt = self.max_retries + 1
+        if attempt > self.max_retries:
+            job.update(index, status="error", error=message)
+            return None
+        return _retry_delay(retry_after, self.backoff * 2 ** (attempt - 1))
+
+    def _observe(self, started, status, error):
+        if self.observer:
+            self.observer(time.perf_counter() - started, status, error)
+
+
+class Dialer(_DialerBase):
+    """Places outbound calls for campaign jobs from a bounded thread pool.
+
+    Calls go straight to the Twilio Calls REST endpoint over one pooled
+    requests.Session. api_base can point at a local fake of the API.
+    """
+
+    def __init__(self, account_sid, auth_token, from_number, **kwargs):
+        super().__init__(account_sid, auth_token, from_number, **kwargs)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="dialer")
+        self.session = requests.Session()
+        self.session.auth = (account_sid, auth_token)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def submit(self, numbers, twiml_url, status_callback=None):
+        job = self._register(CampaignJob(numbers, twiml_url, status_callback, self.store))
+        for i in range(len(numbers)):
+            self.executor.submit(self._dial, job, i)
+        return job
+
+    def create_call(self, to, twiml_url, status_url=None):
+        """POST one call; returns (http_status, json_body or None, retry_after)"""
+        r = self.session.post(self.calls_url, data=self.call_params(to, twiml_url, status_url), timeout=self.timeout)
+        try:
+            body = r.json()
+        except ValueError:
+            body = None
+        return r.status_code, body, r.headers.get("Retry-After")
+
+    def _dial(self, job, index):
+        to = job.results[index]["to"]
+        job.update(index, status="dialing")
+        for attempt in itertools.count(1):
+            self.limiter.acquire()
+            started = self._start_attempt(job, index, attempt)
+            try:
+                response = self.create_call(to, job.twiml_url, job.status_url(index))
+            except requests.RequestException as e:
+                delay = self._settle(job, index, attempt, started, error=e, sent=_request_sent(e))
+            else:
+                delay = self._settle(job, index, attempt, started, response)
+            if delay is None:
+                return
+            time.sleep(delay)
+
+
+class AsyncDialer(_DialerBase):
+    """Dialer that runs every call as a coroutine on an AsyncRuntime.
+
+    Same jobs, rate limit and retry policy as Dialer, but in-flight REST
+    calls cost a coroutine and a pooled connection of the runtime's shared
+    aiohttp session instead of a thread, so max_workers can be in the
+    thousands.
+    """
+
+    def __init__(self, account_sid, auth_token, from_number, runtime, **kwargs):
+        super().__init__(account_sid, auth_token, from_number, **kwargs)
+        self.runtime = runtime
+        self._semaphore = None
+        credentials = base64.b64encode(f"{account_sid}:{auth_token}".encode()).decode()
+        self._headers = {"Authorization": f"Basic {credentials}"}
+
+    def submit(self, numbers, twiml_url, status_callback=None):
+        job = self._register(CampaignJob(numbers, twiml_url, status_callback, self.store))
+        self.runtime.submit(self._dial_all(job))
+        return job
+
+    async def _dial_all(self, job):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+        await asyncio.gather(*(self._dial(job, i) for i in range(len(job.results))))
+
+    async def create_call(self, to, twiml_url, status_url=None):
+        import aiohttp
+
+        async with self.runtime.session.post(
+            self.calls_url, data=self.call_params(to, twiml_url, status_url), headers=self._headers,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        ) as r:
+            try:
+                body = await r.json(content_type=None)
+            except ValueError:
+                body = None
+            return r.status, body, r.headers.get("Retry-After")
+
+    async def _dial(self, job, index):
+        import aiohttp
+
+        async with self._semaphore:
+            to = job.results[index]["to"]
+            job.update(index, status="dialing")
+            for attempt in itertools.count(1):
+                # a shared limiter waits on SQLite, which must not block the loop
+                wait = await asyncio.to_thread(self.limiter.reserve)
+                if wait:
+                    await asyncio.sleep(wait)
+                started = self._start_attempt(job, index, attempt)
+                try:
+                    response = await self.create_call(to, job.twiml_url, job.status_url(index))
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    # only a failed connect is sure not to have sent the request
+                    sent = not isinstance(e, (aiohttp.ClientConnectorError, aiohttp.ConnectionTimeoutError))
+                    delay = self._settle(job, index, attempt, started, error=e, sent=sent)
+                else:
+                    delay = self._settle(job, index, attempt, started, response)
+                if delay is None:
+                    return
+                await asyncio.sleep(delay)
+
+
+def _request_sent(error):
+    """Whether a requests error may have come after the request reached the server"""
+    if isinstance(error, requests.ConnectTimeout):
+        return False
+    if isinstance(error, requests.ConnectionError) and error.args:
+        # a refused or unreachable host; "connection aborted" can come after the request was sent
+        return not isinstance(getattr(error.args[0], "reason", None), NewConnectionError)
+    return True
+
+
+def _retry_delay(retry_after, default):
+    try:
+        return max(float(retry_after), 0)
+    except (TypeError, ValueError):
+        return default
@@ -0,0 +1,426 @@
+"""Append-only log of IVR webhook events with hourly roll-ups.
+
+Every webhook appends one fixed-size binary record (see RECORD) to an
+in-memory buffer. A background thread writes the buffer to the process's
+current segment file and rotates it every rotate_seconds. Rotated
+segments are rolled up into per-hour and per-day aggregates in SQLite by
+whichever worker claims them first, then kept for retention_days so the
+per-call history can still be read with read_segment(). Compaction also
+counts distinct CallSids per hour, under the language each call chose.
+
+Segment files are named <hour>-<owner>-<seq> plus a suffix for their
+stage: .open while written, .seg once rotated, .<owner>.work while being
+compacted and .done afterwards. <owner> is the writing process's pid and a
+nonce (see _owner()), since a restarted container hands its workers the
+same pids again.
+"""
+import glob
+import itertools
+import os
+import sqlite3
+import struct
+import threading
+import time
+from collections import deque
+
+from sqlite_store import ProcessThreads, ThreadConnections, connect
+
+# timestamp, handler latency in ms, CallSid, node, digits, lang, key, and
+# call_lang: the language the caller has chosen so far, empty before that
+RECORD = struct.Struct("<df34s24s8s4s8s4s")
+FIELDS = ("ts", "latency_ms", "call_sid", "node", "digits", "lang", "key", "call_lang")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS hourly (
+    hour INTEGER NOT NULL,
+    node TEXT NOT NULL,
+    lang TEXT NOT NULL,
+    key TEXT NOT NULL,
+    events INTEGER NOT NULL,
+    no_input INTEGER NOT NULL,
+    latency_ms_sum REAL NOT NULL,
+    latency_ms_max REAL NOT NULL,
+    PRIMARY KEY (hour, node, lang, key)
+);
+CREATE TABLE IF NOT EXISTS daily (
+    day INTEGER NOT NULL,
+    node TEXT NOT NULL,
+    lang TEXT NOT NULL,
+    key TEXT NOT NULL,
+    events INTEGER NOT NULL,
+    no_input INTEGER NOT NULL,
+    latency_ms_sum REAL NOT NULL,
+    latency_ms_max REAL NOT NULL,
+    PRIMARY KEY (day, node, lang, key)
+);
+CREATE TABLE IF NOT EXISTS calls (
+    call_sid TEXT PRIMARY KEY,
+    hour INTEGER NOT NULL,
+    lang TEXT NOT NULL,
+    lang_ts REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS calls_hour ON calls (hour);
+CREATE TABLE IF NOT EXISTS hourly_calls (
+    hour INTEGER NOT NULL,
+    lang TEXT NOT NULL,
+    calls INTEGER NOT NULL,
+    PRIMARY KEY (hour, lang)
+);
+CREATE TABLE IF NOT EXISTS daily_calls (
+    day INTEGER NOT NULL,
+    lang TEXT NOT NULL,
+    calls INTEGER NOT NULL,
+    PRIMARY KEY (day, lang)
+);
+CREATE TABLE IF NOT EXISTS compacted (
+    segment TEXT PRIMARY KEY,
+    compacted_at REAL NOT NULL
+);
+"""
+
+UPSERT = (
+    "INSERT INTO {table} ({period}, node, lang, key, events, no_input, latency_ms_sum, latency_ms_max) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT({period}, node, lang, key) DO UPDATE SET "
+    "events = events + excluded.events, no_input = no_input + excluded.no_input, "
+    "latency_ms_sum = latency_ms_sum + excluded.latency_ms_sum, "
+    "latency_ms_max = MAX(latency_ms_max, excluded.latency_ms_max)"
+)
+CALLS_UPSERT = (
+    "INSERT INTO {table} ({period}, lang, calls) VALUES (?, ?, ?) "
+    "ON CONFLICT({period}, lang) DO UPDATE SET calls = calls + excluded.calls"
+)
+
+
+# segment numbers of this process, shared by every EventLog in it
+_seq = itertools.count(1)
+_process = None
+_process_lock = threading.Lock()
+
+
+def _owner():
+    """'<pid>-<nonce>' naming this process in segment file names"""
+    global _process
+    with _process_lock:
+        if _process is None or _process[0] != os.getpid():
+            _process = (os.getpid(), os.urandom(4).hex())
+        return f"{_process[0]}-{_process[1]}"
+
+
+def _text(value, size):
+    return (value or "").encode("utf-8")[:size]
+
+
+def read_segment(path):
+    """Yield every event of a segment file as a dict"""
+    with open(path, "rb") as f:
+        data = f.read()
+    usable = len(data) - len(data) % RECORD.size
+    for values in RECORD.iter_unpack(data[:usable]):
+        event = dict(zip(FIELDS, values))
+        for name in FIELDS[2:]:
+            event[name] = event[name].rstrip(b"\0").decode("utf-8", "replace")
+        yield event
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _owner_alive(owner):
+    pid = int(owner.split("-")[0])
+    if pid == os.getpid():
+        # our own pid under another nonce is an earlier process that had it
+        return owner == _owner()
+    return _pid_alive(pid)
+
+
+def _periods(since, until):
+    """Split [since, until) into (period, start, end) ranges of whole days plus the hours at either end"""
+    first_hour, end_hour = int(since // 3600), int(-(-until // 3600))
+    first_day, end_day = -(-first_hour // 24), end_hour // 24
+    if first_day >= end_day:
+        return [("hour", first_hour, end_hour)]
+    return [("hour", first_hour, first_day * 24), ("day", first_day, end_day), ("hour", end_day * 24, end_hour)]
+
+
+class EventLog:
+    """Buffered binary event log with a background writer and compactor.
+
+    append() only puts a tuple on a deque, so the webhook never waits for
+    disk. One thread per process drains the deque every flush_interval,
+    rotates the segment it writes to, and every compact_interval rolls
+    rotated segments of any worker into the aggregate tables. While the
+    disk refuses writes the thread keeps retrying and the deque holds at
+    most max_buffer events, dropping the oldest.
+    """
+
+    def __init__(self, directory, db_path, flush_interval=0.5, rotate_seconds=60,
+                 max_segment_bytes=16 * 1024 * 1024, compact_interval=30, retention_days=7, max_buffer=100000):
+        self.directory = directory
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.rotate_seconds = rotate_seconds
+        self.max_segment_bytes = max_segment_bytes
+        self.compact_interval = compact_interval
+        self.retention_days = retention_days
+        self.buffer = deque(maxlen=max_buffer)
+        # the segment being written, and packed records taken off the buffer but not yet in it
+        self._segment = None
+        self._unwritten = bytearray()
+        self._conn = ThreadConnections(db_path)
+        self._threads = ProcessThreads(("event-log", self._run))
+        self._stopping = threading.Event()
+        self._stopped = threading.Event()
+
+        os.makedirs(directory, exist_ok=True)
+        conn = connect(db_path)
+        conn.executescript(SCHEMA)
+        conn.close()
+
+    def append(self, call_sid, node, digits, lang, key, latency_ms, call_lang=None):
+        self._threads.ensure_started()
+        self.buffer.append((time.time(), latency_ms, call_sid, node, digits, lang, key, call_lang))
+
+    # ---------------- writer ----------------
+    def _run(self):
+        conn = connect(self.db_path)
+        next_compaction = time.monotonic()
+        while True:
+            stopping = self._stopping.wait(self.flush_interval)
+            try:
+                self._write()
+                segment = self._segment
+                # a segment is only sealed on a record boundary
+                if segment and not self._unwritten and (
+                        stopping or time.time() - segment["opened_at"] >= self.rotate_seconds
+                        or segment["file"].tell() >= self.max_segment_bytes):
+                    self._seal(segment)
+                    self._segment = None
+            except OSError as e:
+                print(f"Event log write failed, will retry: {e}")
+            if stopping:
+                break
+            if time.monotonic() >= next_compaction:
+                next_compaction = time.monotonic() + self.compact_interval
+                try:
+                    self.compact(conn)
+                except (sqlite3.Error, OSError) as e:
+                    print(f"Event log compaction failed, will retry: {e}")
+        conn.close()
+        self._stopped.set()
+
+    def _write(self):
+        # while earlier records are still pending, new ones wait in the bounded deque
+        if not self._unwritten:
+            records = []
+            while True:
+                try:
+                    ts, latency_ms, call_sid, node, digits, lang, key, call_lang = self.buffer.popleft()
+                except IndexError:
+                    break
+                records.append(RECORD.pack(ts, latency_ms, _text(call_sid, 34), _text(node, 24), _text(digits, 8),
+                                           _text(lang, 4), _text(key, 8), _text(call_lang, 4)))
+            self._unwritten += b"".join(records)
+        if not self._unwritten:
+            return
+        if self._segment is None:
+            self._segment = self._open_segment()
+        # unbuffered, so what a failed or short write left out is exactly what stays in _unwritten
+        while self._unwritten:
+            written = self._segment["file"].write(self._unwritten)
+            del self._unwritten[:written]
+
+    def _open_segment(self):
+        now = time.time()
+        base = os.path.join(self.directory, f"{int(now // 3600)}-{_owner()}-{next(_seq)}")
+        return {"base": base, "file": open(base + ".open", "ab", buffering=0), "opened_at": now}
+
+    def _seal(self, segment):
+        # renamed first, so a failed seal leaves the segment open to retry
+        os.replace(segment["base"] + ".open", segment["base"] + ".seg")
+        segment["file"].close()
+
+    # ---------------- compactor ----------------
+    def _claimable(self):
+        """Rotated segments, plus work and open files left behind by dead processes"""
+        paths = glob.glob(os.path.join(self.directory, "*.seg"))
+        leftovers = glob.glob(os.path.join(self.directory, "*.work")) + glob.glob(os.path.join(self.directory, "*.open"))
+        for path in leftovers:
+            name = os.path.basename(path)
+            # <hour>-<pid>-<nonce>-<seq>.open or <hour>-<pid>-<nonce>-<seq>.<pid>-<nonce>.work
+            owner = name.split(".")[1] if name.endswith(".work") else "-".join(name.split("-")[1:3])
+            if not _owner_alive(owner):
+                paths.append(path)
+        return sorted(paths)
+
+    def compact(self, conn=None):
+        """Roll every claimable segment into the aggregates; returns how many were compacted"""
+        conn = conn or self._conn()
+        compacted = 0
+        for path in self._claimable():
+            name = os.path.basename(path).split(".", 1)[0]
+            base = os.path.join(self.directory, name)
+            work = f"{base}.{_owner()}.work"
+            try:
+                # a rename is atomic, so exactly one worker wins each segment
+                os.rename(path, work)
+            except FileNotFoundError:
+                continue
+            try:
+                self._compact_segment(conn, name, work)
+            except BaseException:
+                # hand it back so the next pass of any worker retries it
+                os.replace(work, base + ".seg")
+                raise
+            os.replace(work, base + ".done")
+            compacted += 1
+        self._expire(conn)
+        return compacted
+
+    def _compact_segment(self, conn, name, path):
+        hourly = {}
+        # CallSid -> [first seen, when the language was last seen, language]
+        calls = {}
+        for event in read_segment(path):
+            if event["call_sid"]:
+                call = calls.get(event["call_sid"])
+                if call is None:
+                    call = calls[event["call_sid"]] = [event["ts"], 0.0, ""]
+                call[0] = min(call[0], event["ts"])
+                if event["call_lang"] and event["ts"] >= call[1]:
+                    call[1:] = [event["ts"], event["call_lang"]]
+            key = (int(event["ts"] // 3600), event["node"], event["lang"], event["key"])
+            totals = hourly.get(key)
+            if totals is None:
+                totals = hourly[key] = [0, 0, 0.0, 0.0]
+            totals[0] += 1
+            totals[1] += not event["digits"]
+            totals[2] += event["latency_ms"]
+            totals[3] = max(totals[3], event["latency_ms"])
+        daily = {}
+        for (hour, node, lang, key), (events, no_input, latency_sum, latency_max) in hourly.items():
+            totals = daily.setdefault((hour // 24, node, lang, key), [0, 0, 0.0, 0.0])
+            totals[0] += events
+            totals[1] += no_input
+            totals[2] += latency_sum
+            totals[3] = max(totals[3], latency_max)
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # a segment whose rename back was lost in a crash is not counted twice
+            if conn.execute("SELECT 1 FROM compacted WHERE segment = ?", (name,)).fetchone() is None:
+                conn.executemany(UPSERT.format(table="hourly", period="hour"),
+                                 [k + tuple(v) for k, v in hourly.items()])
+                conn.executemany(UPSERT.format(table="daily", period="day"),
+                                 [k + tuple(v) for k, v in daily.items()])
+                self._count_calls(conn, calls)
+                conn.execute("INSERT INTO compacted (segment, compacted_at) VALUES (?, ?)", (name, time.time()))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _count_calls(self, conn, calls):
+        """Add the segment's calls to the per-hour call counts.
+
+        A call spread over several segments is counted once, in the hour it
+        was first seen and under the latest language it chose; a segment
+        that moves either takes the call off its old (hour, lang) count.
+        """
+        deltas = {}
+
+        def move(hour, lang, calls):
+            deltas[(hour, lang)] = deltas.get((hour, lang), 0) + calls
+
+        for call_sid, (first_ts, lang_ts, lang) in calls.items():
+            hour = int(first_ts // 3600)
+            old = conn.execute("SELECT hour, lang, lang_ts FROM calls WHERE call_sid = ?", (call_sid,)).fetchone()
+            if old is not None:
+                hour = min(hour, old[0])
+                if lang_ts < old[2]:
+                    lang_ts, lang = old[2], old[1]
+                if (hour, lang) == old[:2]:
+                    continue
+                move(old[0], old[1], -1)
+            move(hour, lang, 1)
+            conn.execute(
+                "INSERT INTO calls (call_sid, hour, lang, lang_ts) VALUES (?, ?, ?, ?) ON CONFLICT(call_sid) "
+                "DO UPDATE SET hour = excluded.hour, lang = excluded.lang, lang_ts = excluded.lang_ts",
+                (call_sid, hour, lang, lang_ts),
+            )
+        daily = {}
+        for (hour, lang), n in deltas.items():
+            daily[(hour // 24, lang)] = daily.get((hour // 24, lang), 0) + n
+        conn.executemany(CALLS_UPSERT.format(table="hourly_calls", period="hour"),
+                         [k + (n,) for k, n in deltas.items() if n])
+        conn.executemany(CALLS_UPSERT.format(table="daily_calls", period="day"),
+                         [k + (n,) for k, n in daily.items() if n])
+
+    def _expire(self, conn):
+        cutoff = time.time() - self.retention_days * 86400
+        for path in glob.glob(os.path.join(self.directory, "*.done")):
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        conn.execute("DELETE FROM compacted WHERE compacted_at < ?", (cutoff,))
+        # calls last minutes, so none is still being logged this long after it was first seen
+        conn.execute("DELETE FROM calls WHERE hour < ?", (int(cutoff // 3600),))
+
+    # ---------------- queries ----------------
+    def totals(self, since, until):
+        """{(node, lang, key): (events, no_input, latency_ms_sum, latency_ms_max)} for events in [since, until)
+
+        no_input counts the events that came without any Digits.
+
+        Whole days come from the daily table and only the hours at either
+        end from the hourly one, so the cost does not grow with the range.
+        """
+        totals = {}
+        for period, start, end in _periods(since, until):
+            table = "hourly" if period == "hour" else "daily"
+            rows = self._conn().execute(
+                f"SELECT node, lang, key, SUM(events), SUM(no_input), SUM(latency_ms_sum), MAX(latency_ms_max) "
+                f"FROM {table} WHERE {period} >= ? AND {period} < ? GROUP BY node, lang, key",
+                (start, end),
+            )
+            for node, lang, key, events, no_input, latency_sum, latency_max in rows:
+                current = totals.get((node, lang, key))
+                if current:
+                    events += current[0]
+                    no_input += current[1]
+                    latency_sum += current[2]
+                    latency_max = max(latency_max, current[3])
+                totals[(node, lang, key)] = (events, no_input, latency_sum, latency_max)
+        return totals
+
+    def oldest(self):
+        """Start of the oldest day with events, or None while there are none"""
+        day = self._conn().execute("SELECT MIN(day) FROM daily").fetchone()[0]
+        return None if day is None else day * 86400
+
+    def calls(self, since, until):
+        """{lang: distinct calls} for calls first seen in [since, until)
+
+        lang is the language the call chose last, "" if it never chose one.
+        """
+        calls = {}
+        for period, start, end in _periods(since, until):
+            table = "hourly_calls" if period == "hour" else "daily_calls"
+            rows = self._conn().execute(
+                f"SELECT lang, SUM(calls) FROM {table} WHERE {period} >= ? AND {period} < ? GROUP BY lang",
+                (start, end),
+            )
+            for lang, n in rows:
+                calls[lang] = calls.get(lang, 0) + n
+        return {lang: n for lang, n in calls.items() if n}
+
+    def stop(self, timeout=5):
+        """Write out buffered events and seal the open segment"""
+        self._stopping.set()
+        if self._threads.running():
+            self._stopped.wait(timeout)
@@ -0,0 +1,43 @@
+import gc
+import glob
+import os
+
+from dotenv import load_dotenv
+
+# Workers write Prometheus samples here so /metrics can merge them (see metrics.py).
+# It is emptied when this file is read, not in on_starting: with preload_app the
+# master imports the app, and records the renders of warm_twiml_cache, before
+# on_starting runs.
+PROMETHEUS_MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+if PROMETHEUS_MULTIPROC_DIR:
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+    for _path in glob.glob(os.path.join(PROMETHEUS_MULTIPROC_DIR, "*.db")):
+        os.remove(_path)
+
+# Import the app once in the master: the prompt tables, compiled IVR graph and
+# warmed TwiML cache are then shared copy-on-write by every worker, and a new
+# worker only has to fork. GUNICORN_PRELOAD=0 imports the app in each worker.
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") != "0"
+
+
+# Outbound calls need all of these (see call_me.py); checked once, in the master
+TWILIO_SETTINGS = ("TWILIO_ACCOUNT_SID", "TWILIO_AUTH_TOKEN", "TWILIO_FROM_NUMBER")
+
+
+def on_starting(server):
+    # the same .env call_me.py loads, which has not happened yet without --preload
+    load_dotenv()
+    missing = [name for name in TWILIO_SETTINGS if not os.environ.get(name)]
+    if missing:
+        server.log.warning("Missing Twilio env vars %s: /make-call is disabled, webhooks are served", ", ".join(missing))
+
+
+def pre_fork(server, worker):
+    # keep the collector from touching (and so copying) the preloaded objects
+    gc.freeze()
+
+
+def child_exit(server, worker):
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,211 @@
+from twilio.twiml.voice_response import Dial, VoiceResponse, Gather
+
+# Keys of a compiled row that are not real keypresses
+REPEAT = "repeat"
+INVALID = "invalid"
+ENTRY = "entry"
+
+
+class IvrNode:
+    def __init__(self, name, spec):
+        self.name = name
+        self.path = spec["path"]
+        # nodes with a fixed language are not scoped by ?lang=
+        self.fixed_lang = spec.get("lang")
+        self.hook = spec.get("hook")
+
+    def url(self, base, lang):
+        if self.fixed_lang:
+            return f"{base}{self.path}"
+        return f"{base}{self.path}?lang={lang}"
+
+
+class IvrTable:
+    """Flat transition table compiled from a menu graph.
+
+    rows maps (node, lang) to a dict of keypress -> steps. Menu nodes also
+    carry REPEAT and INVALID rows; nodes without a menu only have ENTRY.
+    """
+
+    def __init__(self, nodes, rows, repeat_keys, default_lang):
+        self.nodes = nodes
+        self.by_path = {node.path: node for node in nodes.values()}
+        self.rows = rows
+        self.repeat_keys = repeat_keys
+        self.default_lang = default_lang
+
+    def lookup(self, node, lang, digits):
+        """Return (lang, key, steps) for a keypress on node"""
+        lang = node.fixed_lang or lang
+        row = self.rows.get((node.name, lang))
+        if row is None:
+            lang = self.default_lang
+            row = self.rows[(node.name, lang)]
+        if ENTRY in row:
+            return lang, ENTRY, row[ENTRY]
+        if digits in row:
+            return lang, digits, row[digits]
+        if digits in self.repeat_keys[node.name]:
+            return lang, REPEAT, row[REPEAT]
+        return lang, INVALID, row[INVALID]
+
+
+def compile_graph(graph, languages, default_lang="en"):
+    """Expand the declarative menu graph into an IvrTable"""
+    nodes = {name: IvrNode(name, spec) for name, spec in graph.items()}
+    rows = {}
+    repeat_keys = {}
+
+    for name, spec in graph.items():
+        repeat_keys[name] = frozenset(spec.get("repeat", ()))
+        langs = [spec["lang"]] if spec.get("lang") else list(languages)
+        for lang in langs:
+            if "entry" in spec:
+                rows[(name, lang)] = {ENTRY: tuple(spec["entry"])}
+                continue
+
+            menu = ("gather", name, spec["prompt"])
+            repeat = (menu,) + tuple(spec["on_timeout"])
+            invalid_prompt = spec.get("invalid_prompt", (spec["prompt"],))
+            row = {
+                REPEAT: repeat,
+                INVALID: (("say", "invalid_selection") + tuple(invalid_prompt),) + repeat,
+            }
+            for digits, steps in spec.get("choices", {}).items():
+                row[digits] = tuple(steps)
+            if "options" in spec:
+                option_map, steps = spec["options"]
+                for digits, option in option_map[lang].items():
+                    row[digits] = tuple(_bind_option(step, option) for step in steps)
+            rows[(name, lang)] = row
+
+    return IvrTable(nodes, rows, repeat_keys, default_lang)
+
+
+def _bind_option(step, option):
+    if step[0] == "say_option":
+        return ("say_text", step[1], option)
+    if step[0] == "record":
+        params = {k: v.format(option=option) for k, v in step[2].items()}
+        return ("record", step[1], params)
+    return step
+
+
+def render(table, steps, base, lang, texts, departments, audio=None, dial=None):
+    """Build the VoiceResponse for a compiled step list.
+
+    audio(lang, text) may return a URL of pre-synthesized audio for a prompt;
+    the prompt is then played instead of spoken. dial(resp, department,
+    timeout, action_url, numbers) appends the <Dial> for a "dial" step;
+    without it every number of the department rings at once.
+    """
+    resp = VoiceResponse()
+    prompts = texts[lang]
+    for step in steps:
+        op = step[0]
+        if op == "set_lang":
+            lang = step[1]
+            prompts = texts[lang]
+        elif op == "say":
+            _say(resp, lang, "".join(prompts[key] for key in step[1:]), audio)
+        elif op == "say_text":
+            _say(resp, lang, prompts[step[1]].format(step[2]), audio)
+        elif op == "gather":
+            target = table.nodes[step[1]]
+            gather = Gather(num_digits=1, action=target.url(base, lang), method="POST", timeout=8)
+            gather_lang = target.fixed_lang or lang
+            _say(gather, gather_lang, texts[gather_lang][step[2]], audio)
+            resp.append(gather)
+        elif op == "redirect":
+            resp.redirect(table.nodes[step[1]].url(base, lang), method="POST")
+        elif op == "dial":
+            department, timeout, action = step[1:4]
+            numbers = step[4] if len(step) > 4 else None
+            if dial:
+                dial(resp, department, timeout, table.nodes[action].url(base, lang), numbers)
+            else:
+                d = Dial(timeout=timeout, action=table.nodes[action].url(base, lang), method="POST")
+                for number in numbers or departments[department]:
+                    d.number(number)
+                resp.append(d)
+        elif op == "record":
+            query = "".join(f"{k}={v}&" for k, v in step[2].items())
+            resp.record(max_length=60, finish_on_key="#",
+                        action=f"{base}{table.nodes[step[1]].path}?{query}lang={lang}",
+                        method="POST")
+        elif op == "hangup":
+            resp.hangup()
+        else:
+            raise ValueError(f"Unknown IVR step {op!r}")
+    return resp
+
+
+def _say(parent, lang, text, audio):
+    url = audio(lang, text) if audio else None
+    if url:
+        parent.play(url)
+    else:
+        parent.say(text)
+
+
+def collect_prompts(table, texts, departments):
+    """Every (lang, text) pair the compiled table can speak"""
+    prompts = set()
+
+    def collect(lang, text):
+        prompts.add((lang, text))
+
+    for (name, lang), row in table.rows.items():
+        for steps in row.values():
+            render(table, steps, "", lang, texts, departments, audio=collect)
+    return prompts
+
+
+def menu_stats(table, totals, calls):
+    """Language mix, drop-off and invalid-input rates from webhook event counts.
+
+    totals maps (node, lang, key) to (events, no_input, latency_ms_sum,
+    latency_ms_max), where no_input counts events without Digits (Twilio
+    following a redirect rather than a keypress). Which menus a reply
+    presented is read back from the compiled table, so only the counts need
+    to be stored. A menu's drop-off is the share of the times it was
+    presented that never got a keypress back. calls maps the language each
+    distinct call chose ("" for none) to the number of such calls.
+    """
+    nodes = {name: {"responses": 0, "keypresses": 0, "invalid": 0, "repeat": 0, "presented": 0,
+                    "latency_ms_sum": 0.0, "max_latency_ms": 0.0} for name in table.nodes}
+    for (name, lang, key), (events, no_input, latency_sum, latency_max) in totals.items():
+        stats = nodes.get(name)
+        if stats is None:
+            continue
+        stats["responses"] += events
+        stats["keypresses"] += events - no_input
+        stats["latency_ms_sum"] += latency_sum
+        stats["max_latency_ms"] = max(stats["max_latency_ms"], latency_max)
+        if key == INVALID:
+            stats["invalid"] += events - no_input
+        elif key == REPEAT:
+            stats["repeat"] += events - no_input
+        for step in table.rows.get((name, lang), {}).get(key, ()):
+            if step[0] == "gather" and step[1] in nodes:
+                nodes[step[1]]["presented"] += events
+
+    report = {}
+    for name, stats in nodes.items():
+        responses, keypresses, presented = stats["responses"], stats["keypresses"], stats["presented"]
+        report[name] = {
+            "responses": responses,
+            "presented": presented,
+            "drop_off": round(1 - min(keypresses / presented, 1), 4) if presented else None,
+            "invalid_rate": round(stats["invalid"] / keypresses, 4) if keypresses else None,
+            "repeat_rate": round(stats["repeat"] / keypresses, 4) if keypresses else None,
+            "avg_latency_ms": round(stats["latency_ms_sum"] / responses, 3) if responses else None,
+            "max_latency_ms": round(stats["max_latency_ms"], 3),
+        }
+    languages = {lang: n for lang, n in calls.items() if lang}
+    chosen = sum(languages.values())
+    return {
+        "calls": sum(calls.values()),
+        "language_mix": {lang: {"calls": n, "share": round(n / chosen, 4)} for lang, n in sorted(languages.items())},
+        "nodes": report,
+    }
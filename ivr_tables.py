@@ -0,0 +1,171 @@
+"""Static IVR tables: department numbers, prompt texts, menu options and the menu graph.
+
+Kept apart from the Flask app so they can be loaded without it (e.g. by
+python -m prompt_audio), and so a --preload gunicorn master builds them
+once and every worker shares them copy-on-write.
+"""
+
+# Ordered numbers per department; <NAME>_NUMBERS=+91...,+91... overrides a list
+DEPARTMENTS = {
+    "appointments": ["+919999999999"],
+    "emergency": ["+911112223334"],
+    "callback_owner": ["+919888888888"]
+}
+
+# How a "dial" step rings a department (see dial_routing.py): "simultaneous"
+# rings every number at once, "sequential" rings one at a time, healthiest
+# first, for leg_timeout seconds each (the last one for the dial step's full
+# timeout). <NAME>_DIAL_MODE overrides the mode.
+DIAL_PLANS = {
+    "emergency": {"mode": "sequential", "leg_timeout": 10},
+}
+
+# Language texts
+LANGUAGES = {
+    "en": {
+        "welcome": "Welcome to HealthyCare Clinic. For English, press 1. For Hindi, press 2. For Marathi, press 3. To repeat this menu press 9.",
+        "no_input": "We did not receive any input. Goodbye.",
+        "invalid_selection": "Invalid selection. ",
+        "choose_language": "Please choose a language.",
+        "return_main": "No input received. Returning to main menu.",
+        "main_menu": "For appointment booking press 1. For emergency help press 2. For pathology tests press 3. To repeat this menu press 9.",
+        "appointment_menu": "For appointment booking. For Dental press 1. For General Doctor press 2. For Orthopaedic press 3. To repeat this menu press 9.",
+        "pathology_menu": "Pathology tests. For regular blood test press 1. For full body profile press 2. For heart check up press 3. To repeat this menu press 9.",
+        "emergency_connect": "Connecting you to emergency services. Please hold.",
+        "emergency_fail": "Unable to connect to emergency number. Goodbye.",
+        "appointment_thanks": "Thank you. You selected {}. Our team will call you soon to schedule a convenient time.",
+        "appointment_record": "If you would like to leave a short message with your preferred time or details, please record after the tone. Press hash when finished. To repeat the previous menu press 9.",
+        "pathology_thanks": "Thank you. You selected {}. Our staff will call you shortly to arrange an appointment and share instructions.",
+        "pathology_record": "If you want to leave a message for preferred timing, record after the tone. Press hash when finished. To repeat the previous menu press 9.",
+        "thankyou_goodbye": "Thank you. Goodbye.",
+        "recording_saved": "Your message has been recorded. We will contact you soon. Goodbye."
+    },
+    "hi": {
+        "welcome": "स्वागत है हेल्थीकेयर क्लिनिक में। अंग्रेजी के लिए, 1 दबाएं। हिंदी के लिए, 2 दबाएं। मराठी के लिए 3 दबाएं। इस मेनू को दोहराने के लिए 9 दबाएं।",
+        "no_input": "हमें कोई इनपुट प्राप्त नहीं हुआ। अलविदा।",
+        "invalid_selection": "अमान्य चयन। ",
+        "choose_language": "कृपया एक भाषा चुनें।",
+        "return_main": "कोई इनपुट प्राप्त नहीं हुआ। मुख्य मेनू पर वापस जा रहे हैं।",
+        "main_menu": "अपॉइंटमेंट बुकिंग के लिए 1 दबाएं। इमरजेंसी हेल्प के लिए 2 दबाएं। पैथोलॉजी टेस्ट के लिए 3 दबाएं। इस मेनू को दोहराने के लिए 9 दबाएं।",
+        "appointment_menu": "अपॉइंटमेंट बुकिंग के लिए। डेंटल के लिए 1 दबाएं। जनरल डॉक्टर के लिए 2 दबाएं। ऑर्थोपेडिक के लिए 3 दबाएं। इस मेनू को दोहराने के लिए 9 दबाएं।",
+        "pathology_menu": "पैथोलॉजी टेस्ट। रेगुलर ब्लड टेस्ट के लिए 1 दबाएं। फुल बॉडी प्रोफाइल के लिए 2 दबाएं। हार्ट चेक अप के लिए 3 दबाएं। इस मेनू को दोहराने के लिए 9 दबाएं।",
+        "emergency_connect": "आपको इमरजेंसी सर्विसेज से कनेक्ट किया जा रहा है। कृपया प्रतीक्षा करें।",
+        "emergency_fail": "इमरजेंसी नंबर से कनेक्ट नहीं हो पा रहे हैं। अलविदा।",
+        "appointment_thanks": "धन्यवाद। आपने {} चुना है। हमारी टीम जल्द ही आपको एक सुविधाजनक समय निर्धारित करने के लिए कॉल करेगी।",
+        "appointment_record": "यदि आप अपने पसंदीदा समय या विवरण के साथ एक छोटा संदेश छोड़ना चाहते हैं, कृपया टोन के बाद रिकॉर्ड करें। समाप्त करने पर हैश दबाएं। पिछले मेनू को दोहराने के लिए 9 दबाएं।",
+        "pathology_thanks": "धन्यवाद। आपने {} चुना है। हमारा स्टाफ जल्द ही आपके साथ एक अपॉइंटमेंट व्यवस्थित करने और निर्देश साझा करने के लिए कॉल करेगा।",
+        "pathology_record": "यदि आप पसंदीदा समय के लिए कोई संदेश छोड़ना चाहते हैं, टोन के बाद रिकॉर्ड करें। समाप्त करने पर हैश दबाएं। पिछले मेनू को दोहराने के लिए 9 दबाएं।",
+        "thankyou_goodbye": "धन्यवाद। अलविदा।",
+        "recording_saved": "आपका संदेश रिकॉर्ड कर लिया गया है। हम जल्द ही आपसे संपर्क करेंगे। अलविदा।"
+    },
+    # Marathi added (approximate translations)
+    "mr": {
+        "welcome": "हेल्थीकेअर क्लिनिकमध्ये आपले स्वागत आहे. इंग्रजीसाठी 1 दाबा. हिंदीसाठी 2 दाबा. मराठीसाठी 3 दाबा. हा मेनू पुन्हा ऐकण्यासाठी 9 दाबा.",
+        "no_input": "आपला इनपुट मिळाला नाही. अलविदा.",
+        "invalid_selection": "अवैध निवड. ",
+        "choose_language": "कृपया भाषा निवडा.",
+        "return_main": "कोणताही इनपुट मिळाला नाही. मुख्य मेन्यूकडे परत जात आहोत.",
+        "main_menu": "अपॉइंटमेंट बुक करण्यासाठी 1 दाबा. आपत्कालीन मदतीसाठी 2 दाबा. पॅथॉलॉजी चाचणीसाठी 3 दाबा. हा मेनू पुन्हा ऐकण्यासाठी 9 दाबा.",
+        "appointment_menu": "अपॉइंटमेंट बुकिंगसाठी. डेन्टल साठी 1 दाबा. जनरल डॉक्टर साठी 2 दाबा. अर्थोपेडिक साठी 3 दाबा. हा मेनू पुन्हा ऐकण्यासाठी 9 दाबा.",
+        "pathology_menu": "पॅथॉलॉजी टेस्ट. नियमित रक्त तपासणीसाठी 1 दाबा. फुल बॉडी प्रोफाइलसाठी 2 दाबा. हार्ट चेकअपसाठी 3 दाबा. हा मेनू पुन्हा ऐकण्यासाठी 9 दाबा.",
+        "emergency_connect": "आपल्याला आपत्कालीन सेवांशी जोडले जात आहे. कृपया थांबा.",
+        "emergency_fail": "आपत्कालीन नंबरशी कनेक्ट करता येत नाही. अलविदा.",
+        "appointment_thanks": "धन्यवाद. आपण {} निवडले. आमची टीम लवकरच आपल्याला कॉल करून वेळ ठरवेल.",
+        "appointment_record": "आपण आपला पसंतीचा वेळ किंवा तपशील सांगणारा छोटा संदेश ठेवू इच्छित असल्यास, टोननंतर रेकॉर्ड करा. पूर्ण झाल्यावर हैश दाबा. मागील मेनू पुन्हा ऐकण्यासाठी 9 दाबा.",
+        "pathology_thanks": "धन्यवाद. आपण {} निवडले. आमचे कर्मचारी लवकरच आपल्याशी संपर्क करेल.",
+        "pathology_record": "पसंत वेळेकरता संदेश ठेवायचा असल्यास, टोननंतर रेकॉर्ड करा. पूर्ण झाल्यावर हैश दाबा. मागील मेनू पुन्हा ऐकण्यासाठी 9 दाबा.",
+        "thankyou_goodbye": "धन्यवाद. अलविदा.",
+        "recording_saved": "आपला संदेश रेकॉर्ड केला गेला आहे. आम्ही लवकरच संपर्क करू. अलविदा."
+    }
+}
+
+# Doctor and test mappings in English, Hindi, Marathi
+DOCTOR_MAP = {
+    "en": {"1": "Dental", "2": "General Doctor", "3": "Orthopaedic"},
+    "hi": {"1": "डेंटल", "2": "जनरल डॉक्टर", "3": "ऑर्थोपेडिक"},
+    "mr": {"1": "डेन्टल", "2": "जनरल डॉक्टर", "3": "ऑर्थोपेडिक"}
+}
+
+TEST_MAP = {
+    "en": {"1": "regular blood test", "2": "full body profile", "3": "heart check up"},
+    "hi": {"1": "रेगुलर ब्लड टेस्ट", "2": "फुल बॉडी प्रोफाइल", "3": "हार्ट चेक अप"},
+    "mr": {"1": "नियमित रक्त तपासणी", "2": "फुल बॉडी प्रोफाइल", "3": "हार्ट चेकअप"}
+}
+
+# ---------------- IVR menu graph ----------------
+# Every webhook is a node of this graph. Menu nodes gather one digit and map
+# each keypress to the steps that make up the TwiML reply; "repeat" keys and
+# anything unmapped replay the menu. Prompts are keys into LANGUAGES, and
+# "options" nodes get one choice per entry of DOCTOR_MAP/TEST_MAP, so adding
+# a department or test is a table change. The graph is compiled into a flat
+# (node, lang) -> keypress table at startup, see ivr.py.
+IVR_GRAPH = {
+    "voice": {
+        "path": "/voice",
+        "methods": ["POST", "GET"],
+        "lang": "en",
+        # use language neutral prompt (twilio will use account default or TwiML language if set)
+        "entry": [("gather", "language", "welcome"), ("say", "no_input"), ("hangup",)],
+    },
+    "language": {
+        "path": "/handle-language",
+        "lang": "en",
+        "prompt": "welcome",
+        "invalid_prompt": ["choose_language"],
+        "repeat": ["9"],
+        "on_timeout": [("say", "no_input"), ("hangup",)],
+        "choices": {
+            digits: [("set_lang", lang), ("gather", "main", "main_menu"), ("say", "return_main"), ("redirect", "voice")]
+            for digits, lang in (("1", "en"), ("2", "hi"), ("3", "mr"))
+        },
+    },
+    "main": {
+        "path": "/handle-main",
+        "prompt": "main_menu",
+        "repeat": ["9", ""],
+        "on_timeout": [("say", "return_main"), ("redirect", "language")],
+        "choices": {
+            "1": [("gather", "appointment", "appointment_menu"), ("say", "return_main"), ("redirect", "language")],
+            "2": [("say", "emergency_connect"), ("dial", "emergency", 30, "emergency_dial")],
+            "3": [("gather", "pathology", "pathology_menu"), ("say", "return_main"), ("redirect", "language")],
+        },
+    },
+    "appointment": {
+        "path": "/handle-appointment-doctor",
+        "prompt": "appointment_menu",
+        "repeat": ["9", ""],
+        "on_timeout": [("say", "return_main"), ("redirect", "main")],
+        "options": (DOCTOR_MAP, [
+            ("say_option", "appointment_thanks"),
+            ("say", "appointment_record"),
+            ("record", "recording", {"type": "appointment", "doctor": "{option}"}),
+            ("say", "thankyou_goodbye"),
+            ("hangup",),
+        ]),
+    },
+    "pathology": {
+        "path": "/handle-pathology",
+        "prompt": "pathology_menu",
+        "repeat": ["9", ""],
+        "on_timeout": [("say", "return_main"), ("redirect", "main")],
+        "options": (TEST_MAP, [
+            ("say_option", "pathology_thanks"),
+            ("say", "pathology_record"),
+            ("record", "recording", {"type": "pathology", "test": "{option}"}),
+            ("say", "thankyou_goodbye"),
+            ("hangup",),
+        ]),
+    },
+    # Dial action callback: rings the next number after a missed leg, or
+    # gives up once every number has been tried
+    "emergency_dial": {
+        "path": "/handle-emergency-dial",
+        "hook": "dial_failover",
+        "entry": [("say", "emergency_fail"), ("hangup",)],
+    },
+    "recording": {
+        "path": "/handle-recording",
+        "hook": "recording",
+        "entry": [("say", "recording_saved"), ("hangup",)],
+    },
+}
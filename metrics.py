@@ -0,0 +1,107 @@
+import os
+import time
+
+from flask import Response, g, request
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+# With several gunicorn workers set PROMETHEUS_MULTIPROC_DIR (see
+# gunicorn.conf.py): every worker writes its samples there and /metrics
+# merges them, whichever worker serves the scrape.
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+# Webhook latencies are a few ms when cached; REST calls take hundreds
+FAST_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5)
+REST_BUCKETS = (.05, .1, .25, .5, .75, 1, 1.5, 2.5, 5, 10)
+# A person picking up takes seconds
+ANSWER_BUCKETS = (1, 2, 3, 5, 8, 10, 15, 20, 30, 45, 60)
+
+REQUEST_LATENCY = Histogram(
+    "ivr_http_request_duration_seconds", "Time spent serving a request, by endpoint",
+    ["endpoint", "method", "status"], buckets=FAST_BUCKETS,
+)
+TWIML_RENDER = Histogram(
+    "ivr_twiml_render_duration_seconds", "Time spent building and serializing a TwiML document on a cache miss",
+    ["node"], buckets=FAST_BUCKETS,
+)
+TWILIO_API_LATENCY = Histogram(
+    "ivr_twilio_api_request_duration_seconds", "Latency of Twilio REST calls made by the dialer",
+    ["status"], buckets=REST_BUCKETS,
+)
+TWILIO_API_ERRORS = Counter(
+    "ivr_twilio_api_errors_total", "Failed Twilio REST calls made by the dialer", ["reason"],
+)
+MENU_EVENTS = Counter(
+    "ivr_menu_events_total",
+    "Webhook hits per IVR node; digits is the key pressed or 'none' when Twilio sent no input",
+    ["node", "lang", "digits", "outcome"],
+)
+
+DIAL_LEGS = Counter(
+    "ivr_dial_legs_total", "Dialed department legs by outcome (answered, busy, no-answer, failed)",
+    ["department", "outcome"],
+)
+DIAL_TIME_TO_ANSWER = Histogram(
+    "ivr_dial_time_to_answer_seconds",
+    "Seconds from a caller being put through to a department until a number answers",
+    ["department"], buckets=ANSWER_BUCKETS,
+)
+
+KNOWN_DIGITS = frozenset("0123456789*#")
+
+
+def observe_menu(node, lang, digits, outcome):
+    if not digits:
+        digits = "none"
+    elif digits not in KNOWN_DIGITS:
+        digits = "other"
+    MENU_EVENTS.labels(node, lang, digits, outcome).inc()
+
+
+def observe_twilio_api(elapsed, status, error=None):
+    """Dialer observer: status is the HTTP status or None when no response came back"""
+    TWILIO_API_LATENCY.labels(str(status) if status else "none").observe(elapsed)
+    if error is not None:
+        TWILIO_API_ERRORS.labels(str(status) if status else type(error).__name__).inc()
+    elif status and status >= 300:
+        TWILIO_API_ERRORS.labels(str(status)).inc()
+
+
+def observe_dial(department, outcome, time_to_answer=None):
+    DIAL_LEGS.labels(department, outcome).inc()
+    if time_to_answer is not None:
+        DIAL_TIME_TO_ANSWER.labels(department).observe(time_to_answer)
+
+
+def time_render(node, render):
+    """Wrap render() so its time is observed; it should return the serialized document"""
+    def timed():
+        started = time.perf_counter()
+        try:
+            return render()
+        finally:
+            TWIML_RENDER.labels(node).observe(time.perf_counter() - started)
+    return timed
+
+
+def init_app(app):
+    @app.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _observe_request(response):
+        started = g.pop("metrics_started", None)
+        if started is not None and request.endpoint != "metrics":
+            REQUEST_LATENCY.labels(request.endpoint or "unmatched", request.method, str(response.status_code)) \
+                .observe(time.perf_counter() - started)
+        return response
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics():
+        if MULTIPROC_DIR:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
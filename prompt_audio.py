@@ -0,0 +1,131 @@
+"""Pre-synthesized prompt audio.
+
+Every prompt the IVR can say is rendered offline into an audio file named
+after a hash of its language and text. At runtime the IVR plays the file
+when it exists and falls back to <Say> when it does not, so a missing or
+stale asset never breaks a call.
+
+Build the cache with:
+
+    python -m prompt_audio --synth stub
+    python -m prompt_audio --synth mypackage.tts:Synthesizer
+"""
+import argparse
+import hashlib
+import importlib
+import io
+import os
+import threading
+import wave
+
+
+def prompt_key(lang, text):
+    return hashlib.sha256(f"{lang}\n{text}".encode("utf-8")).hexdigest()[:32]
+
+
+class StubSynthesizer:
+    """Writes silent WAV files roughly as long as the prompt; for tests and local runs"""
+
+    extension = "wav"
+
+    def synthesize(self, text, lang):
+        buf = io.BytesIO()
+        with wave.open(buf, "wb") as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(8000)
+            w.writeframes(b"\0\0" * 8000 * min(len(text) // 12 + 1, 30))
+        return buf.getvalue()
+
+
+SYNTHESIZERS = {
+    "stub": StubSynthesizer,
+}
+
+
+def load_synthesizer(name):
+    """A registered name or a "module:Class" path to any object with synthesize() and extension"""
+    if name in SYNTHESIZERS:
+        return SYNTHESIZERS[name]()
+    module, _, attr = name.partition(":")
+    return getattr(importlib.import_module(module), attr)()
+
+
+class PromptAudio:
+    """Index of the audio files present in the cache directory.
+
+    The directory is rescanned only when its mtime changes, which is what
+    version() reports so cached TwiML can be dropped when assets appear.
+    """
+
+    def __init__(self, directory, route="/prompt-audio"):
+        self.directory = directory
+        self.route = route
+        self._files = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+        self.version()
+
+    def version(self):
+        try:
+            mtime = os.stat(self.directory).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._mtime:
+            with self._lock:
+                files = {}
+                if mtime is not None:
+                    for name in os.listdir(self.directory):
+                        key, ext = os.path.splitext(name)
+                        if ext and not name.endswith(".part"):
+                            files[key] = name
+                self._files = files
+                self._mtime = mtime
+        return mtime
+
+    def url(self, base, lang, text):
+        name = self._files.get(prompt_key(lang, text))
+        if name is None:
+            return None
+        return f"{base}{self.route}/{name}"
+
+
+def build(directory, synthesizer, prompts, force=False):
+    """Synthesize every (lang, text) pair missing from directory; returns (written, skipped)"""
+    os.makedirs(directory, exist_ok=True)
+    existing = {os.path.splitext(n)[0] for n in os.listdir(directory)}
+    written = skipped = 0
+    for lang, text in sorted(prompts):
+        key = prompt_key(lang, text)
+        if key in existing and not force:
+            skipped += 1
+            continue
+        path = os.path.join(directory, f"{key}.{synthesizer.extension}")
+        with open(path + ".part", "wb") as f:
+            f.write(synthesizer.synthesize(text, lang))
+        os.replace(path + ".part", path)
+        written += 1
+    return written, skipped
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-synthesize every IVR prompt into the audio cache")
+    parser.add_argument("--synth", default="stub", help="registered synthesizer name or module:Class")
+    parser.add_argument("--out", default=None, help="cache directory (default PROMPT_AUDIO_DIR)")
+    parser.add_argument("--force", action="store_true", help="re-synthesize prompts that already exist")
+    args = parser.parse_args(argv)
+
+    # only the tables are needed, not the app
+    from dotenv import load_dotenv
+    from ivr import collect_prompts, compile_graph
+    from ivr_tables import DEPARTMENTS, IVR_GRAPH, LANGUAGES
+
+    load_dotenv()
+    directory = args.out or os.path.abspath(os.getenv("PROMPT_AUDIO_DIR", "prompt_audio"))
+    prompts = collect_prompts(compile_graph(IVR_GRAPH, LANGUAGES), LANGUAGES, DEPARTMENTS)
+    written, skipped = build(directory, load_synthesizer(args.synth), prompts)
+    print(f"{written} prompts synthesized, {skipped} already cached in {directory}")
+
+
+if __name__ == "__main__":
+    main()
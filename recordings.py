@@ -0,0 +1,203 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from sqlite_store import ProcessThreads, connect
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS recordings (
+    recording_sid TEXT PRIMARY KEY,
+    call_sid TEXT,
+    url TEXT,
+    duration INTEGER,
+    caller TEXT,
+    rtype TEXT,
+    extra TEXT,
+    lang TEXT,
+    received_at REAL,
+    audio_path TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    download_error TEXT
+);
+CREATE INDEX IF NOT EXISTS recordings_pending ON recordings (audio_path, next_attempt_at);
+"""
+
+COLUMNS = ("recording_sid", "call_sid", "url", "duration", "caller", "rtype", "extra", "lang", "received_at")
+
+
+class RecordingIngest:
+    """Takes recording callbacks off the webhook path.
+
+    submit() only puts the event on a bounded queue. A writer thread commits
+    queued events to SQLite in batches, and a download thread streams the
+    audio of every committed row that has no file yet. Because downloads are
+    driven from the table, anything not fetched before a restart is picked
+    up again on the next start. Every worker runs a downloader; each one
+    leases a row for download_lease seconds before fetching it, so a
+    recording is downloaded once however many workers see it.
+    """
+
+    def __init__(self, db_path, audio_dir, auth=None, audio_format="mp3", max_queue=10000,
+                 batch_size=200, flush_interval=0.2, max_attempts=5, chunk_size=64 * 1024, download_lease=300):
+        self.db_path = db_path
+        self.audio_dir = audio_dir
+        self.audio_format = audio_format
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.chunk_size = chunk_size
+        self.download_lease = download_lease
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.auth = auth
+        self._wake_downloader = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = ProcessThreads(("recording-writer", self._writer), ("recording-downloader", self._downloader))
+
+        os.makedirs(audio_dir, exist_ok=True)
+        conn = connect(db_path, isolation_level="")
+        conn.executescript(SCHEMA)
+        conn.close()
+
+    def submit(self, event):
+        """Queue a recording event; falls back to a direct insert when the queue is full"""
+        self._threads.ensure_started()
+        event = dict(event, received_at=event.get("received_at") or time.time())
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            conn = connect(self.db_path, isolation_level="")
+            try:
+                self._insert(conn, [event])
+            finally:
+                conn.close()
+            self._wake_downloader.set()
+
+    def _insert(self, conn, events):
+        rows = [tuple(e.get(c) for c in COLUMNS) for e in events]
+        with conn:
+            conn.executemany(
+                f"INSERT OR IGNORE INTO recordings ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                rows,
+            )
+
+    def _writer(self):
+        conn = connect(self.db_path, isolation_level="")
+        while not (self._stopping.is_set() and self.queue.empty()):
+            try:
+                batch = [self.queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            while True:
+                try:
+                    self._insert(conn, batch)
+                    break
+                except sqlite3.Error as e:
+                    # keep the batch in hand until the store takes it
+                    print(f"Recording batch insert failed, retrying: {e}")
+                    time.sleep(1)
+            for _ in batch:
+                self.queue.task_done()
+            self._wake_downloader.set()
+        conn.close()
+
+    def _session(self):
+        # requests is only loaded once a worker has recordings to fetch
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        session.auth = self.auth
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _downloader(self):
+        conn = connect(self.db_path, isolation_level="")
+        session = self._session()
+        while not self._stopping.is_set():
+            try:
+                downloading = self._download_pending(conn, session)
+            except sqlite3.Error as e:
+                # e.g. locked by another worker's writes; a row leased meanwhile is retried once its lease ends
+                print(f"Recording download pass failed, retrying: {e}")
+                self._stopping.wait(5)
+                continue
+            if not downloading:
+                self._wake_downloader.wait(timeout=5)
+                self._wake_downloader.clear()
+        conn.close()
+
+    def _download_pending(self, conn, session):
+        """Download one batch of due recordings; False if none was due"""
+        rows = conn.execute(
+            "SELECT recording_sid, url, attempts FROM recordings "
+            "WHERE audio_path IS NULL AND url IS NOT NULL AND attempts < ? AND next_attempt_at <= ? "
+            "ORDER BY received_at LIMIT 50",
+            (self.max_attempts, time.time()),
+        ).fetchall()
+        for sid, url, attempts in rows:
+            if self._stopping.is_set():
+                break
+            if self._claim(conn, sid):
+                self._download_one(conn, session, sid, url, attempts)
+        return bool(rows)
+
+    def _claim(self, conn, sid):
+        """Lease sid to this downloader; False if another worker got it first"""
+        now = time.time()
+        with conn:
+            claimed = conn.execute(
+                "UPDATE recordings SET next_attempt_at = ? "
+                "WHERE recording_sid = ? AND audio_path IS NULL AND attempts < ? AND next_attempt_at <= ?",
+                (now + self.download_lease, sid, self.max_attempts, now),
+            ).rowcount
+        return claimed == 1
+
+    def _download_one(self, conn, session, sid, url, attempts):
+        import requests
+
+        path = os.path.join(self.audio_dir, f"{sid}.{self.audio_format}")
+        tmp = f"{path}.{os.getpid()}.part"
+        try:
+            with session.get(f"{url}.{self.audio_format}", stream=True, timeout=30) as r:
+                r.raise_for_status()
+                with open(tmp, "wb") as f:
+                    for chunk in r.iter_content(chunk_size=self.chunk_size):
+                        f.write(chunk)
+            os.replace(tmp, path)
+        except (requests.RequestException, OSError) as e:
+            with conn:
+                conn.execute(
+                    "UPDATE recordings SET attempts = attempts + 1, next_attempt_at = ?, download_error = ? "
+                    "WHERE recording_sid = ?",
+                    (time.time() + 2 ** attempts * 5, str(e), sid),
+                )
+            return
+        with conn:
+            conn.execute(
+                "UPDATE recordings SET audio_path = ?, attempts = attempts + 1, download_error = NULL "
+                "WHERE recording_sid = ?",
+                (path, sid),
+            )
+
+    def stop(self, timeout=5):
+        """Flush queued events and stop the background threads"""
+        if self._threads.running():
+            deadline = time.monotonic() + timeout
+            while self.queue.unfinished_tasks and time.monotonic() < deadline:
+                time.sleep(0.05)
+        self._stopping.set()
+        self._wake_downloader.set()
@@ -0,0 +1,61 @@
+"""SQLite plumbing shared by the stores every worker on the host uses.
+
+Each store keeps its data in a WAL-mode file that all gunicorn workers
+read and write concurrently, and does its writing from background threads
+that are started in each worker process.
+"""
+import os
+import sqlite3
+import threading
+
+
+def connect(db_path, timeout=30, isolation_level=None):
+    """Open db_path in WAL mode; autocommit unless an isolation_level is given"""
+    conn = sqlite3.connect(db_path, timeout=timeout, isolation_level=isolation_level, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class ThreadConnections:
+    """Calling it returns the current thread's own connection to db_path"""
+
+    def __init__(self, db_path, **options):
+        self.db_path = db_path
+        self.options = options
+        self._local = threading.local()
+
+    def __call__(self):
+        # connections must not cross a fork, e.g. from a --preload master
+        if getattr(self._local, "pid", None) != os.getpid():
+            self._local.conn = connect(self.db_path, **self.options)
+            self._local.pid = os.getpid()
+        return self._local.conn
+
+
+class ProcessThreads:
+    """Daemon threads started once in every process that uses a store.
+
+    Threads do not survive a fork, so a store built in a --preload master
+    starts them from the first call each worker makes instead.
+    """
+
+    def __init__(self, *threads):
+        # (name, target) pairs
+        self.threads = threads
+        self.pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        if self.pid == os.getpid():
+            return
+        with self._lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            for name, target in self.threads:
+                threading.Thread(target=target, name=name, daemon=True).start()
+
+    def running(self):
+        """Whether the threads were started in this process"""
+        return self.pid == os.getpid()
@@ -0,0 +1,151 @@
+import socket
+import time
+
+import pytest
+
+from aio import AsyncRuntime
+from bench.fake_twilio import FakeTwilio
+from campaign_store import CampaignStore
+from dialer import AsyncDialer, Dialer
+
+
+@pytest.fixture
+def make_fake():
+    fakes = []
+
+    def make(**kwargs):
+        fakes.append(FakeTwilio(**kwargs).start())
+        return fakes[-1]
+
+    yield make
+    for fake in fakes:
+        fake.stop()
+
+
+@pytest.fixture(params=["sync", "async"])
+def make_dialer(request):
+    """Builds a Dialer, or an AsyncDialer on its own runtime, that records every attempt's status"""
+    runtimes = []
+
+    def make(fake, **kwargs):
+        statuses = []
+        options = dict(api_base=fake.url, max_workers=1, calls_per_second=1000, max_retries=3, backoff=0.01,
+                       observer=lambda elapsed, status, error: statuses.append(status))
+        options.update(kwargs)
+        if request.param == "async":
+            pytest.importorskip("aiohttp")
+            runtimes.append(AsyncRuntime())
+            dialer = AsyncDialer("ACtest", "token", "+15550000000", runtimes[-1], **options)
+        else:
+            dialer = Dialer("ACtest", "token", "+15550000000", **options)
+        dialer.statuses = statuses
+        return dialer
+
+    yield make
+    for runtime in runtimes:
+        runtime.close()
+
+
+def wait_done(job, timeout=10):
+    deadline = time.monotonic() + timeout
+    while job.to_dict(include_results=False)["state"] != "done":
+        assert time.monotonic() < deadline, "job did not finish"
+        time.sleep(0.01)
+    return job.to_dict()
+
+
+def test_retries_until_queued(make_fake, make_dialer):
+    # every other call create is answered with a 503
+    fake = make_fake(error_rate=0.5)
+    dialer = make_dialer(fake)
+    data = wait_done(dialer.submit(["+1001", "+1002", "+1003"], "http://ivr.test/voice"))
+
+    assert data["counts"] == {"queued": 3}
+    assert [r["attempts"] for r in data["results"]] == [2, 2, 2]
+    assert all(r["sid"] and r["error"] is None for r in data["results"])
+    assert fake.calls_created == 6
+    assert dialer.statuses == [503, 201] * 3
+    assert data["finished_at"] is not None
+
+
+def test_gives_up_after_max_retries(make_fake, make_dialer):
+    fake = make_fake(error_rate=1.0)
+    dialer = make_dialer(fake, max_retries=2)
+    data = wait_done(dialer.submit(["+1001"], "http://ivr.test/voice"))
+
+    assert data["results"][0]["status"] == "error"
+    assert data["results"][0]["attempts"] == 3
+    assert data["results"][0]["error"] == "service unavailable"
+    assert fake.calls_created == 3
+
+
+def test_retries_refused_connections(make_fake, make_dialer):
+    # a port nothing listens on
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        url = f"http://127.0.0.1:{sock.getsockname()[1]}"
+    dialer = make_dialer(make_fake(), api_base=url, max_retries=2)
+    data = wait_done(dialer.submit(["+1001"], "http://ivr.test/voice"))
+
+    assert data["results"][0]["status"] == "error"
+    assert data["results"][0]["attempts"] == 3
+    assert dialer.statuses == [None] * 3
+
+
+def test_does_not_redial_after_a_read_timeout(make_fake, make_dialer):
+    # the call is created, but the answer comes after the dialer gave up on it
+    fake = make_fake(latency=0.3)
+    dialer = make_dialer(fake, timeout=0.1)
+    data = wait_done(dialer.submit(["+1001"], "http://ivr.test/voice"))
+    time.sleep(0.4)
+
+    assert data["counts"] == {"unknown": 1}
+    assert data["results"][0]["attempts"] == 1
+    assert fake.calls_created == 1
+
+
+def test_waits_for_retry_after(make_fake, make_dialer):
+    fake = make_fake(error_rate=0.5, retry_after="0.3")
+    # the backoff alone would not let the job finish before wait_done gives up
+    dialer = make_dialer(fake, backoff=60)
+    data = wait_done(dialer.submit(["+1001"], "http://ivr.test/voice"))
+
+    assert data["results"][0]["status"] == "queued"
+    assert fake.created_at[1] - fake.created_at[0] >= 0.3
+
+
+def test_rate_limit(make_fake, make_dialer):
+    fake = make_fake()
+    dialer = make_dialer(fake, max_workers=8, calls_per_second=20)
+    wait_done(dialer.submit([f"+1{i:03}" for i in range(10)], "http://ivr.test/voice"))
+
+    assert fake.calls_created == 10
+    # one token up front, then one every 1/20 s
+    assert fake.created_at[-1] - fake.created_at[0] >= 9 / 20 * 0.9
+
+
+def test_rate_limit_is_shared_through_rate_db(make_fake, make_dialer, tmp_path):
+    fake = make_fake()
+    rate_db = str(tmp_path / "dialer.db")
+    dialers = [make_dialer(fake, max_workers=8, calls_per_second=20, rate_db=rate_db) for _ in range(2)]
+    jobs = [d.submit([f"+1{i:03}" for i in range(5)], "http://ivr.test/voice") for d in dialers]
+    for job in jobs:
+        wait_done(job)
+
+    assert fake.calls_created == 10
+    assert fake.created_at[-1] - fake.created_at[0] >= 9 / 20 * 0.9
+
+
+def test_progress_is_shared_through_store(make_fake, make_dialer, tmp_path):
+    fake = make_fake(error_rate=0.5)
+    db_path = str(tmp_path / "dialer.db")
+    store = CampaignStore(db_path, flush_interval=0.01)
+    dialer = make_dialer(fake, store=store)
+    data = wait_done(dialer.submit(["+1001", "+1002"], "http://ivr.test/voice"))
+    store.stop()
+
+    # another worker, which never saw the job
+    other = make_dialer(fake, store=CampaignStore(db_path))
+    assert other.get(data["job_id"]) is None
+    assert other.load(data["job_id"]) == data
+    assert other.load("unknown") is None
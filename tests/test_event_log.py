@@ -0,0 +1,44 @@
+import itertools
+import time
+
+import event_log
+from event_log import EventLog
+
+
+def restart(monkeypatch):
+    """Makes this process look like a fresh one that was handed the same pid"""
+    monkeypatch.setattr(event_log, "_process", None)
+    monkeypatch.setattr(event_log, "_seq", itertools.count(1))
+
+
+def events(log):
+    return sum(totals[0] for totals in log.totals(0, time.time() + 3600).values())
+
+
+def test_restart_under_the_same_pid_keeps_events(tmp_path, monkeypatch):
+    directory, db_path = str(tmp_path / "events"), str(tmp_path / "events.db")
+    for _ in range(2):
+        restart(monkeypatch)
+        log = EventLog(directory, db_path, flush_interval=0.01, compact_interval=3600)
+        for i in range(5):
+            log.append(f"CA{i}", "main", "1", "en", "1", 1.0)
+        log.stop()
+        log.compact()
+
+    assert events(log) == 10
+    assert len(list((tmp_path / "events").glob("*.done"))) == 2
+
+
+def test_open_segment_of_an_earlier_process_with_our_pid_is_compacted(tmp_path, monkeypatch):
+    directory, db_path = str(tmp_path / "events"), str(tmp_path / "events.db")
+    restart(monkeypatch)
+    crashed = EventLog(directory, db_path)
+    # written but never sealed, as when the process is killed
+    crashed.buffer.extend([(time.time(), 1.0, "CA1", "main", "1", "en", "1", "en")] * 3)
+    crashed._write()
+    assert crashed.compact() == 0
+
+    restart(monkeypatch)
+    log = EventLog(directory, db_path)
+    assert log.compact() == 1
+    assert events(log) == 3
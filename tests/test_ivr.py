@@ -0,0 +1,73 @@
+"""Pins the TwiML of every IVR route for every language and keypress.
+
+The expected documents are in ivr_twiml.json. After a deliberate change to
+the menus or prompts, rewrite it with python -m tests.test_ivr and review
+the diff.
+"""
+import importlib
+import json
+import os
+import tempfile
+
+import pytest
+
+EXPECTED = os.path.join(os.path.dirname(__file__), "ivr_twiml.json")
+ROUTES = ("/voice", "/handle-language", "/handle-main", "/handle-appointment-doctor", "/handle-pathology",
+          "/handle-recording")
+LANGS = ("en", "hi", "mr")
+# no input, every menu choice, repeat and an invalid key
+DIGITS = ("", "1", "2", "3", "4", "9", "*")
+
+
+def app_env(directory):
+    """Settings that keep call_me's stores in directory and speak every prompt with <Say>"""
+    return {
+        "RECORDINGS_DB": os.path.join(directory, "recordings.db"),
+        "RECORDINGS_DIR": os.path.join(directory, "recordings"),
+        "CALL_STATE_DB": "",
+        "CALL_STATUS_DB": os.path.join(directory, "call_status.db"),
+        "DIALER_DB": os.path.join(directory, "dialer.db"),
+        "EVENT_LOG_DIR": os.path.join(directory, "events"),
+        "EVENT_LOG_DB": os.path.join(directory, "events.db"),
+        "PROMPT_AUDIO_ENABLED": "0",
+    }
+
+
+def render_all(client):
+    documents = {}
+    for route in ROUTES:
+        for lang in LANGS:
+            for digits in DIGITS:
+                r = client.post(f"{route}?lang={lang}", data={"Digits": digits})
+                assert r.status_code == 200
+                documents[f"{route}|{lang}|{digits}"] = r.get_data(as_text=True)
+    return documents
+
+
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    with pytest.MonkeyPatch.context() as mp:
+        for name, value in app_env(str(tmp_path_factory.mktemp("ivr"))).items():
+            mp.setenv(name, value)
+        mp.delenv("PUBLIC_BASE_URL", raising=False)
+        yield importlib.import_module("call_me").app.test_client()
+
+
+def test_twiml_matches_expected(client):
+    with open(EXPECTED, encoding="utf-8") as f:
+        expected = json.load(f)
+    actual = render_all(client)
+
+    assert sorted(actual) == sorted(expected)
+    for key in expected:
+        assert actual[key] == expected[key], key
+
+
+if __name__ == "__main__":
+    os.environ.update(app_env(tempfile.mkdtemp()))
+    os.environ.pop("PUBLIC_BASE_URL", None)
+    documents = render_all(importlib.import_module("call_me").app.test_client())
+    with open(EXPECTED, "w", encoding="utf-8") as f:
+        json.dump(documents, f, ensure_ascii=False, indent=1, sort_keys=True)
+        f.write("\n")
+    print(f"Wrote {len(documents)} documents to {EXPECTED}")
@@ -0,0 +1,90 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+def tables_version(*tables):
+    """Fingerprint of the prompt tables, used to drop stale cached TwiML"""
+    blob = json.dumps(tables, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha1(blob).hexdigest()
+
+
+class TwimlCache:
+    """Bounded LRU of rendered TwiML documents.
+
+    Keys are (node, lang, keypress, base_url) tuples and values are the XML
+    bytes. Every entry belongs to one version of the prompt tables; when
+    version_fn() starts returning something new the whole cache is dropped
+    and on_change (if given) is called.
+    version_fn is re-evaluated at most once every check_interval seconds so
+    the fingerprint is not recomputed on every webhook.
+    """
+
+    def __init__(self, version_fn, max_entries=512, enabled=True, check_interval=5.0, on_change=None):
+        self.version_fn = version_fn
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.check_interval = check_interval
+        self.on_change = on_change
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = version_fn()
+        self._checked_at = time.monotonic()
+
+    def _check_version(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        version = self.version_fn()
+        if version != self._version:
+            self._version = version
+            self._entries.clear()
+            if self.on_change:
+                self.on_change()
+
+    def check_version(self):
+        """Drop the cache now if the prompt tables changed"""
+        with self._lock:
+            self._check_version()
+
+    def get_or_render(self, key, render):
+        """Return cached bytes for key, calling render() for them on a miss"""
+        if not self.enabled:
+            return render()
+
+        with self._lock:
+            self._check_version()
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return body
+            self.misses += 1
+            version = self._version
+
+        # render outside the lock so a slow build does not stall other workers' threads
+        body = render()
+
+        with self._lock:
+            if version == self._version:
+                self._entries[key] = body
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return body
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "version": self._version,
+            }